@@ -1,9 +1,12 @@
-import os
+import io
 import csv
+import atexit
+import asyncio
 import logging
-import tempfile
+import threading
 from datetime import datetime
 from pathlib import Path
+from typing import Optional
 
 from aiogram import Router, F, Bot
 from aiogram.types import Message, CallbackQuery, Voice
@@ -11,6 +14,7 @@ from aiogram.filters import Command, CommandStart
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
+from src.pipeline import MusicRecommendationPipeline
 from .keyboards import get_main_keyboard, get_tracks_keyboard, get_feedback_keyboard
 
 logger = logging.getLogger(__name__)
@@ -24,30 +28,114 @@ class UserStates(StatesGroup):
     waiting_voice = State()
 
 
-def save_feedback(user_id: int, feedback: str, transcript: str, emotion: str, 
-                  response_text: str, tracks: list):
-    file_exists = FEEDBACK_FILE.exists()
-    
-    tracks_str = "; ".join([f"{t.get('artist', '')} - {t.get('name', '')}" for t in tracks])
+_feedback_fh = None
+_feedback_writer = None
+_feedback_lock = threading.Lock()
+
+
+def _get_feedback_writer():
+    global _feedback_fh, _feedback_writer
     
-    with open(FEEDBACK_FILE, "a", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
+    if _feedback_writer is None:
+        FEEDBACK_FILE.parent.mkdir(parents=True, exist_ok=True)
+        _feedback_fh = open(FEEDBACK_FILE, "a", newline="", encoding="utf-8", buffering=64 * 1024)
+        _feedback_writer = csv.writer(_feedback_fh)
+        atexit.register(_feedback_fh.close)
         
-        if not file_exists:
-            writer.writerow([
+        if _feedback_fh.tell() == 0:
+            _feedback_writer.writerow([
                 "timestamp", "user_id", "feedback", "transcript", 
                 "emotion", "response_text", "tracks"
             ])
-        
-        writer.writerow([
-            datetime.now().isoformat(),
-            user_id,
-            feedback,
-            transcript,
-            emotion,
-            response_text,
-            tracks_str
-        ])
+    
+    return _feedback_writer
+
+
+def _feedback_row(user_id: int, feedback: str, transcript: str, emotion: str,
+                  response_text: str, tracks: list) -> list:
+    tracks_str = "; ".join(f"{t.get('artist', '')} - {t.get('name', '')}" for t in tracks)
+    
+    return [
+        datetime.now().isoformat(),
+        user_id,
+        feedback,
+        transcript,
+        emotion,
+        response_text,
+        tracks_str
+    ]
+
+
+def _write_feedback_rows(rows: list):
+    with _feedback_lock:
+        writer = _get_feedback_writer()
+        writer.writerows(rows)
+        _feedback_fh.flush()
+
+
+def save_feedback(user_id: int, feedback: str, transcript: str, emotion: str, 
+                  response_text: str, tracks: list):
+    _write_feedback_rows([
+        _feedback_row(user_id, feedback, transcript, emotion, response_text, tracks)
+    ])
+
+
+FEEDBACK_BATCH_SIZE = 16
+FEEDBACK_FLUSH_INTERVAL = 2.0
+
+_feedback_queue: Optional[asyncio.Queue] = None
+
+
+def enqueue_feedback(user_id: int, feedback: str, transcript: str, emotion: str,
+                     response_text: str, tracks: list):
+    row = _feedback_row(user_id, feedback, transcript, emotion, response_text, tracks)
+    
+    if _feedback_queue is None:
+        _write_feedback_rows([row])
+    else:
+        _feedback_queue.put_nowait(row)
+
+
+async def feedback_writer_loop():
+    global _feedback_queue
+    
+    queue = _feedback_queue = asyncio.Queue()
+    loop = asyncio.get_running_loop()
+    pending = []
+    write = None
+    
+    try:
+        while True:
+            pending.append(await queue.get())
+            deadline = loop.time() + FEEDBACK_FLUSH_INTERVAL
+            
+            while len(pending) < FEEDBACK_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    pending.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            rows, pending = pending, []
+            write = asyncio.ensure_future(asyncio.to_thread(_write_feedback_rows, rows))
+            try:
+                await asyncio.shield(write)
+            except Exception as e:
+                logger.error("Error saving feedback: %s", e)
+            write = None
+    finally:
+        _feedback_queue = None
+        if write is not None:
+            try:
+                await write
+            except Exception as e:
+                logger.error("Error saving feedback: %s", e)
+        while not queue.empty():
+            pending.append(queue.get_nowait())
+        if pending:
+            _write_feedback_rows(pending)
 
 
 @router.message(CommandStart())
@@ -122,26 +210,44 @@ async def btn_find_music(message: Message, state: FSMContext):
 
 
 @router.message(F.voice)
-async def handle_voice(message: Message, state: FSMContext, bot: Bot):
+async def handle_voice(message: Message, state: FSMContext, bot: Bot, pipeline: MusicRecommendationPipeline):
     processing_msg = await message.answer("Обрабатываю голосовое сообщение...")
     
     try:
         voice: Voice = message.voice
         file = await bot.get_file(voice.file_id)
         
-        with tempfile.NamedTemporaryFile(suffix=".ogg", delete=False) as temp_file:
-            temp_path = temp_file.name
-        
-        await bot.download_file(file.file_path, temp_path)
+        buffer = io.BytesIO()
+        await bot.download_file(file.file_path, destination=buffer)
         
         await processing_msg.edit_text("Голосовое получено! Анализирую эмоции и текст...")
         
-        from src.pipeline import get_pipeline
+        tracks_sent = False
+        shown_text = ""
+        result = None
         
-        pipeline = get_pipeline()
-        result = pipeline.process_audio(audio_path=temp_path, top_k=5, user_id=message.from_user.id)
-        
-        os.unlink(temp_path)
+        async for partial in pipeline.aprocess_audio_stream(
+            audio_bytes=buffer,
+            top_k=5,
+            user_id=message.from_user.id
+        ):
+            result = partial.result
+            
+            if partial.stage == "transcript":
+                await processing_msg.edit_text(
+                    f"Я услышал: {result.transcript}\n"
+                    f"Эмоция в голосе: {result.audio_emotion}\n\n"
+                    "Подбираю треки..."
+                )
+            elif partial.stage == "tracks" and result.tracks:
+                await message.answer(
+                    "Подборка для тебя:",
+                    reply_markup=get_tracks_keyboard(result.track_dicts)
+                )
+                tracks_sent = True
+            elif partial.stage == "response" and result.response_text != shown_text:
+                shown_text = result.response_text
+                await processing_msg.edit_text(f"{shown_text}...")
         
         if not result.success:
             await processing_msg.edit_text(result.error_message)
@@ -160,7 +266,7 @@ async def handle_voice(message: Message, state: FSMContext, bot: Bot):
         await processing_msg.edit_text(response_text)
         
         if result.tracks:
-            tracks_data = [t.to_dict() for t in result.tracks]
+            tracks_data = result.track_dicts
             
             await state.update_data(
                 last_transcript=result.transcript,
@@ -169,10 +275,11 @@ async def handle_voice(message: Message, state: FSMContext, bot: Bot):
                 last_tracks=tracks_data
             )
             
-            await message.answer(
-                "Подборка для тебя:",
-                reply_markup=get_tracks_keyboard(tracks_data)
-            )
+            if not tracks_sent:
+                await message.answer(
+                    "Подборка для тебя:",
+                    reply_markup=get_tracks_keyboard(tracks_data)
+                )
             
             await message.answer(
                 "Подборка понравилась?",
@@ -184,16 +291,10 @@ async def handle_voice(message: Message, state: FSMContext, bot: Bot):
         await processing_msg.edit_text(
             f"Произошла ошибка при обработке. Попробуй еще раз или отправь другое сообщение."
         )
-        
-        if 'temp_path' in locals() and os.path.exists(temp_path):
-            os.unlink(temp_path)
 
 
-@router.message(F.text)
+@router.message(F.text & ~F.text.startswith("/"))
 async def handle_text(message: Message, state: FSMContext):
-    if message.text.startswith("/"):
-        return
-    
     await message.answer(
         "Для подбора музыки отправь голосовое сообщение!\n"
         "Я анализирую не только слова, но и эмоции в твоем голосе.",
@@ -220,10 +321,10 @@ async def callback_feedback(callback: CallbackQuery, state: FSMContext):
     
     data = await state.get_data()
     
-    logger.info(f"Feedback received: {feedback_type}, data: {data}")
+    logger.info("Feedback received: %s, data: %s", feedback_type, data)
     
     try:
-        save_feedback(
+        enqueue_feedback(
             user_id=callback.from_user.id,
             feedback=feedback_type,
             transcript=data.get("last_transcript", ""),
@@ -231,9 +332,9 @@ async def callback_feedback(callback: CallbackQuery, state: FSMContext):
             response_text=data.get("last_response", ""),
             tracks=data.get("last_tracks", [])
         )
-        logger.info(f"Feedback saved to {FEEDBACK_FILE}")
+        logger.info("Feedback queued for %s", FEEDBACK_FILE)
     except Exception as e:
-        logger.error(f"Error saving feedback: {e}")
+        logger.error("Error saving feedback: %s", e)
     
     if feedback_type == "good":
         await callback.answer("Спасибо! Рад, что понравилось!")
@@ -1,3 +1,5 @@
+from functools import cache
+
 from aiogram.types import (
     InlineKeyboardMarkup, 
     InlineKeyboardButton,
@@ -6,6 +8,7 @@ from aiogram.types import (
 )
 
 
+@cache
 def get_main_keyboard() -> ReplyKeyboardMarkup:
     keyboard = ReplyKeyboardMarkup(
         keyboard=[
@@ -18,23 +21,21 @@ def get_main_keyboard() -> ReplyKeyboardMarkup:
     return keyboard
 
 
+_INVALID_NAMES = frozenset({"", "unknown", "nan", "none"})
+_INVALID_ARTISTS = _INVALID_NAMES | {"unknown artist"}
+
+
 def format_track_button(track: dict, max_len: int = 45) -> str:
-    artist = track.get("artist", "")
-    name = track.get("name", "")
+    artist = (track.get("artist") or "").lower()
+    name = (track.get("name") or "").lower()
     
-    if not artist or artist.lower() in ["unknown", "nan", "none", "unknown artist"]:
+    if artist in _INVALID_ARTISTS:
         artist = ""
     
-    if not name or name.lower() in ["unknown", "nan", "none"]:
+    if name in _INVALID_NAMES:
         name = "track"
     
-    artist = artist.lower()
-    name = name.lower()
-    
-    if artist:
-        text = f"{artist} — {name}"
-    else:
-        text = name
+    text = f"{artist} — {name}" if artist else name
     
     if len(text) > max_len:
         text = text[:max_len-1] + "…"
@@ -49,7 +50,7 @@ def get_tracks_keyboard(tracks: list) -> InlineKeyboardMarkup:
         url = track.get("spotify_url") or track.get("url", "")
         spotify_id = track.get("spotify_id", "")
         
-        if not url and spotify_id and spotify_id not in ["nan", "None", ""]:
+        if not url and spotify_id and spotify_id not in ("nan", "None", ""):
             url = f"https://open.spotify.com/track/{spotify_id}"
         
         if url and url != "#" and "nan" not in url.lower():
@@ -66,6 +67,7 @@ def get_tracks_keyboard(tracks: list) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
+@cache
 def get_feedback_keyboard() -> InlineKeyboardMarkup:
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [
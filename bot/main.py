@@ -1,21 +1,16 @@
 import os
 import sys
-import ssl
 import asyncio
 import logging
-import certifi
-
-ssl._create_default_https_context = ssl._create_unverified_context
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
-from dotenv import load_dotenv
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from bot.handlers import router
-
-load_dotenv()
+from bot.handlers import router, feedback_writer_loop
+from config.settings import settings
+from src.pipeline import get_pipeline, warm_pipeline
 
 logging.basicConfig(
     level=logging.INFO,
@@ -24,31 +19,72 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def preload_models():
-    logger.info("Preloading models...")
-    
+WARMUP_SECONDS = 1.0
+
+
+def _load_whisper():
     logger.info("Loading Whisper...")
-    import whisper
-    whisper.load_model("small")
-    
+    from src.audio.processor import get_audio_processor
+    get_audio_processor()._load_whisper()
+
+
+def _load_hubert():
     logger.info("Loading HuBERT emotion model...")
-    from transformers import pipeline
-    pipeline("audio-classification", model="superb/hubert-large-superb-er")
+    from src.audio.emotion import get_emotion_classifier
+    get_emotion_classifier()._load_model()
+
+
+def _load_dataset():
+    logger.info("Loading tracks dataset...")
+    get_pipeline().music_recommender._load_data()
+
+
+def _warmup_models():
+    import numpy as np
+    from config.settings import TARGET_SAMPLE_RATE
+    from src.audio.processor import get_audio_processor
+    
+    processor = get_audio_processor()
+    silence = np.zeros(int(TARGET_SAMPLE_RATE * WARMUP_SECONDS), dtype=np.float32)
+    processor._get_emotion_classifier().classify(silence, TARGET_SAMPLE_RATE)
+    processor.transcribe(silence, TARGET_SAMPLE_RATE)
+
+
+async def preload_models():
+    logger.info("Preloading models...")
     
+    try:
+        await asyncio.gather(
+            asyncio.to_thread(_load_whisper),
+            asyncio.to_thread(_load_hubert),
+            asyncio.to_thread(_load_dataset)
+        )
+    except Exception as e:
+        logger.error("Model preload failed: %s", e)
+        return
     logger.info("Models loaded!")
+    
+    try:
+        await asyncio.to_thread(_warmup_models)
+        logger.info("Models warmed up!")
+    except Exception as e:
+        logger.warning("Model warmup failed: %s", e)
 
 
 async def main():
-    bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
+    bot_token = settings.telegram_bot_token
     
     if not bot_token:
         logger.error("TELEGRAM_BOT_TOKEN not found in .env")
         sys.exit(1)
     
-    preload_models()
+    pipeline = await asyncio.to_thread(warm_pipeline)
+    preload_task = asyncio.create_task(preload_models())
+    feedback_task = asyncio.create_task(feedback_writer_loop())
     
     bot = Bot(token=bot_token, default=DefaultBotProperties())
     dp = Dispatcher()
+    dp["pipeline"] = pipeline
     dp.include_router(router)
     
     logger.info("Bot starting...")
@@ -59,9 +95,13 @@ async def main():
         await dp.start_polling(bot)
         
     except Exception as e:
-        logger.exception(f"Bot error: {e}")
+        logger.exception("Bot error: %s", e)
         
     finally:
+        if not preload_task.done():
+            preload_task.cancel()
+        feedback_task.cancel()
+        await asyncio.gather(feedback_task, return_exceptions=True)
         await bot.session.close()
 
 
@@ -1,31 +1,70 @@
-import os
 import asyncio
+import weakref
 from pathlib import Path
-from dotenv import load_dotenv
+from typing import Optional
 
-load_dotenv()
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 PROJECT_ROOT = Path(__file__).parent.parent
 DATA_DIR = PROJECT_ROOT / "data"
 
 TRACKS_DATASET_PATH = DATA_DIR / "tracks_with_language_FINAL.csv"
 GENRES_DATASET_PATH = DATA_DIR / "all_genres_from_tracks_dataset.csv"
+SEMANTIC_CACHE_PATH = DATA_DIR / "semantic_cache.npz"
+SPOTIFY_CACHE_PATH = DATA_DIR / "spotify_cache.sqlite"
+TRACK_ANALYSIS_CACHE_PATH = DATA_DIR / "track_analysis_cache.sqlite"
 
-TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+TARGET_SAMPLE_RATE = 16000
 
-GIGACHAT_API_KEY = os.getenv("GIGACHAT_API_KEY")
-DEFAULT_MODEL = os.getenv("DEFAULT_MODEL", "GigaChat-2-Max")
 
-SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
-SPOTIFY_CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
+class Settings(BaseSettings):
+    model_config = SettingsConfigDict(
+        env_file=PROJECT_ROOT / ".env",
+        env_file_encoding="utf-8",
+        extra="ignore"
+    )
+    
+    telegram_bot_token: Optional[str] = None
+    
+    gigachat_api_key: Optional[str] = None
+    default_model: str = "GigaChat-2-Max"
+    
+    spotify_client_id: Optional[str] = None
+    spotify_client_secret: Optional[str] = None
+    
+    redis_url: Optional[str] = None
+    semantic_cache_model: Optional[str] = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+    semantic_cache_threshold: float = 0.92
+    
+    whisper_model_size: str = "small"
+    whisper_device: str = "auto"
+    whisper_compute_type: str = ""
+    use_silero_vad: bool = True
+    
+    emotion_batch_size: int = 8
+    emotion_batch_window_ms: int = 30
+    
+    llm_batch_size: int = 1
+    llm_batch_window_ms: int = 30
+    
+    default_top_k: int = 5
+    
+    n_retry: int = 3
+    retry_delay: int = 2
+    task_concurrency: int = 5
+    
+    metrics_enabled: bool = True
+    log_level: str = "INFO"
 
-WHISPER_MODEL_SIZE = os.getenv("WHISPER_MODEL_SIZE", "small")
-TARGET_SAMPLE_RATE = 16000
 
-DEFAULT_TOP_K = int(os.getenv("DEFAULT_TOP_K", "5"))
+settings = Settings()
+
+_task_semaphores = weakref.WeakKeyDictionary()
 
-N_RETRY = int(os.getenv("N_RETRY", "3"))
-RETRY_DELAY = int(os.getenv("RETRY_DELAY", "2"))
-TASK_SEMAPHORE = asyncio.Semaphore(5)
 
-LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+def get_task_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphore = _task_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _task_semaphores[loop] = asyncio.Semaphore(settings.task_concurrency)
+    return semaphore
@@ -1,3 +1,4 @@
+import csv
 import pandas as pd
 import sys
 from pathlib import Path
@@ -6,19 +7,41 @@ DATA_DIR = Path(__file__).parent.parent / "data"
 METRICS_FILE = DATA_DIR / "metrics.csv"
 FEEDBACK_FILE = DATA_DIR / "feedback.csv"
 
+METRICS_COLUMNS = {
+    "success", "processing_time_sec", "audio_duration_sec",
+    "audio_valid", "validation_error", "emotion",
+    "intents_count", "intents_genre", "intents_language",
+    "llm_success", "llm_time_sec",
+    "response_first_token_sec", "response_time_sec",
+    "tracks_found", "tracks_from_dataset", "tracks_from_spotify",
+    "target_valence", "target_energy", "target_danceability", "target_tempo",
+}
+FEEDBACK_COLUMNS = {"feedback", "emotion"}
+
+CATEGORY_COLUMNS = {"emotion", "intents_language", "validation_error", "feedback"}
+
+
+def read_columns(path: Path, columns: set) -> pd.DataFrame:
+    with open(path, newline="", encoding="utf-8") as f:
+        header = next(csv.reader(f), [])
+    
+    usecols = [c for c in header if c in columns]
+    dtype = {c: "category" for c in usecols if c in CATEGORY_COLUMNS}
+    return pd.read_csv(path, engine="pyarrow", usecols=usecols, dtype=dtype)
+
 
 def load_data():
     metrics_df = None
     feedback_df = None
     
     if METRICS_FILE.exists():
-        metrics_df = pd.read_csv(METRICS_FILE)
+        metrics_df = read_columns(METRICS_FILE, METRICS_COLUMNS)
         print(f"Загружено {len(metrics_df)} записей метрик")
     else:
         print("Файл metrics.csv не найден")
     
     if FEEDBACK_FILE.exists():
-        feedback_df = pd.read_csv(FEEDBACK_FILE)
+        feedback_df = read_columns(FEEDBACK_FILE, FEEDBACK_COLUMNS)
         print(f"Загружено {len(feedback_df)} отзывов")
     else:
         print("Файл feedback.csv не найден")
@@ -61,6 +84,7 @@ def analyze_metrics(df):
         
         if "validation_error" in df.columns:
             errors = df[df["audio_valid"] == False]["validation_error"].value_counts()
+            errors = errors[errors > 0]
             if not errors.empty:
                 print(f"  Причины отклонения:")
                 for reason, count in errors.items():
@@ -83,10 +107,7 @@ def analyze_metrics(df):
         genres = df["intents_genre"].dropna()
         genres = genres[genres != ""]
         if not genres.empty:
-            all_genres = []
-            for g in genres:
-                all_genres.extend(g.split(","))
-            genre_counts = pd.Series(all_genres).value_counts()
+            genre_counts = genres.str.split(",").explode().str.strip().value_counts()
             print(f"\n  Топ жанры:")
             for genre, count in genre_counts.head(5).items():
                 print(f"    - {genre}: {count}")
@@ -105,6 +126,11 @@ def analyze_metrics(df):
         if "llm_time_sec" in df.columns:
             print(f"  Среднее время: {df['llm_time_sec'].mean():.2f} сек")
     
+    if "response_first_token_sec" in df.columns and "response_time_sec" in df.columns:
+        print(f"\nГенерация ответа:")
+        print(f"  Первый токен: {df['response_first_token_sec'].mean():.2f} сек")
+        print(f"  Полный ответ: {df['response_time_sec'].mean():.2f} сек")
+    
     if "tracks_found" in df.columns:
         with_tracks = (df["tracks_found"] > 0).sum()
         print(f"\nРекомендации (Hit Rate):")
@@ -156,16 +182,19 @@ def analyze_feedback(df):
     
     if "emotion" in df.columns:
         print(f"\nОтзывы по эмоциям:")
-        grouped = df.groupby("emotion")["feedback"].value_counts().unstack(fill_value=0)
+        grouped = df.groupby("emotion", observed=True)["feedback"].value_counts().unstack(fill_value=0)
         if not grouped.empty:
-            for emotion in grouped.index:
-                row = grouped.loc[emotion]
-                good = row.get("good", 0)
-                bad = row.get("bad", 0)
-                total_em = good + bad
-                if total_em > 0:
-                    rate = good / total_em * 100
-                    print(f"  {emotion}: {good}/{total_em} положительных ({rate:.0f}%)")
+            grouped = grouped.reindex(columns=["good", "bad"], fill_value=0)
+            totals = grouped.sum(axis=1)
+            grouped = grouped[totals > 0]
+            totals = totals[totals > 0]
+            rates = grouped["good"] / totals * 100
+            lines = [
+                f"  {emotion}: {good}/{total_em} положительных ({rate:.0f}%)"
+                for emotion, good, total_em, rate in zip(grouped.index, grouped["good"], totals, rates)
+            ]
+            if lines:
+                print("\n".join(lines))
 
 
 def main():
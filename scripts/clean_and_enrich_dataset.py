@@ -1,34 +1,164 @@
 import os
+import csv
 import sys
 import time
+import shelve
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable, Iterator, Tuple
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
 from dotenv import load_dotenv
 
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
 BASE_DIR = Path(__file__).parent.parent
 INPUT_CSV = BASE_DIR / "data" / "tracks_with_language_FINAL.csv"
 OUTPUT_CSV = BASE_DIR / "data" / "tracks_cleaned.csv"
+OUTPUT_PARQUET = OUTPUT_CSV.with_suffix(".parquet")
+OUTPUT_FEATHER = OUTPUT_CSV.with_suffix(".feather")
 DOTENV_PATH = BASE_DIR / ".env"
+ARTIST_CACHE_PATH = BASE_DIR / "data" / "spotify_artists_cache"
+
+INPUT_DTYPES = {
+    "spotify_id": "string",
+    "name": "string",
+    "artist_clean": "string",
+    "artists": "string",
+    "artist_spotify_id": "string",
+    "release_date": "string",
+    "genres": "string",
+    "valence": "float32",
+    "energy": "float32",
+    "danceability": "float32",
+    "acousticness": "float32",
+    "instrumentalness": "float32",
+    "liveness": "float32",
+    "speechiness": "float32",
+    "loudness": "float32",
+    "tempo": "float32",
+}
+
+PASSTHROUGH_COLUMNS = ["language", "explicit", "popularity", "duration_ms", "mode", "key"]
+NUMERIC_PASSTHROUGH_COLUMNS = ["popularity", "duration_ms", "mode", "key"]
+EXPLICIT_VALUES = {"true": True, "1": True, "false": False, "0": False}
+
+SIMPLE_ARTIST_LIST_PATTERN = r"""\[(?:'[^'"\\]*'|"[^'"\\]*")(?:\s*,\s*(?:'[^'"\\]*'|"[^'"\\]*"))*\]"""
+
+OUTPUT_COLUMNS = [
+    "spotify_id", "name", "artist", "year", "release_date",
+    "genres", "language", "popularity", "explicit",
+    "valence", "energy", "danceability", "acousticness", 
+    "tempo", "instrumentalness", "liveness", "loudness",
+    "speechiness", "duration_ms", "mode", "key"
+]
+WORKING_COLUMNS = OUTPUT_COLUMNS + ["artist_spotify_id"]
+FLOAT_COLUMNS = [
+    "valence", "energy", "danceability", "acousticness", "tempo",
+    "instrumentalness", "liveness", "loudness", "speechiness"
+]
+
+CHUNK_SIZE = 200_000
+CSV_BLOCK_SIZE = 64 << 20
+
+SPOTIFY_WORKERS = 8
+SPOTIFY_REQUESTS_PER_MINUTE = 180
 
 load_dotenv(DOTENV_PATH)
 
 
-def load_dataset() -> pd.DataFrame:
+class RateLimiter:
+    def __init__(self, per_minute: int):
+        self.interval = 60.0 / per_minute
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+    
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+        
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def fetch_in_batches(fetch: Callable[[list], Any], ids: list, batch_size: int, label: str) -> Iterator[Any]:
+    batches = [ids[i:i+batch_size] for i in range(0, len(ids), batch_size)]
+    limiter = RateLimiter(SPOTIFY_REQUESTS_PER_MINUTE)
+    
+    def run(batch):
+        limiter.wait()
+        return fetch(batch)
+    
+    with ThreadPoolExecutor(max_workers=SPOTIFY_WORKERS) as pool:
+        futures = [pool.submit(run, batch) for batch in batches]
+        
+        for done, future in enumerate(as_completed(futures), start=1):
+            logger.info(f"{label}: batch {done}/{len(batches)}")
+            try:
+                yield future.result()
+            except Exception as e:
+                logger.error(f"Error processing batch: {e}")
+
+
+def load_dataset_chunks(chunksize: int = CHUNK_SIZE) -> Iterator[pd.DataFrame]:
     logger.info(f"Loading dataset from {INPUT_CSV}")
-    df = pd.read_csv(INPUT_CSV, low_memory=False)
-    logger.info(f"Loaded {len(df)} tracks")
-    return df
+    with open(INPUT_CSV, newline="", encoding="utf-8-sig") as f:
+        header = next(csv.reader(f), [])
+    
+    dtype = {c: t for c, t in INPUT_DTYPES.items() if c in header}
+    column_types = {c: pa.type_for_alias(t) for c, t in dtype.items()}
+    column_types.update({c: pa.string() for c in PASSTHROUGH_COLUMNS if c in header})
+    reader = pa_csv.open_csv(
+        INPUT_CSV,
+        read_options=pa_csv.ReadOptions(block_size=CSV_BLOCK_SIZE),
+        convert_options=pa_csv.ConvertOptions(
+            column_types=column_types,
+            include_columns=[c for c in header if c in column_types],
+            strings_can_be_null=True
+        )
+    )
+    
+    def to_chunk(batches: List[pa.RecordBatch]) -> pd.DataFrame:
+        chunk = pa.Table.from_batches(batches).to_pandas().astype(dtype)
+        for col in NUMERIC_PASSTHROUGH_COLUMNS:
+            if col in chunk.columns:
+                chunk[col] = pd.to_numeric(chunk[col], errors="coerce")
+        if "explicit" in chunk.columns:
+            chunk["explicit"] = chunk["explicit"].str.lower().map(EXPLICIT_VALUES)
+        logger.info(f"Loaded chunk of {len(chunk)} tracks")
+        return chunk
+    
+    batches, rows = [], 0
+    for batch in reader:
+        batches.append(batch)
+        rows += batch.num_rows
+        if rows >= chunksize:
+            yield to_chunk(batches)
+            batches, rows = [], 0
+    if batches:
+        yield to_chunk(batches)
 
 
-def remove_duplicates(df: pd.DataFrame) -> pd.DataFrame:
+def remove_duplicates(df: pd.DataFrame, seen_ids: Optional[set] = None) -> pd.DataFrame:
     before = len(df)
     df = df.drop_duplicates(subset=["spotify_id"], keep="first")
+    if seen_ids is not None:
+        df = df[~df["spotify_id"].isin(seen_ids)]
+        seen_ids.update(df["spotify_id"])
     after = len(df)
     logger.info(f"Removed {before - after} duplicates, {after} tracks remaining")
     return df
@@ -36,26 +166,17 @@ def remove_duplicates(df: pd.DataFrame) -> pd.DataFrame:
 
 def remove_empty_names(df: pd.DataFrame) -> pd.DataFrame:
     before = len(df)
-    df = df.dropna(subset=["name"])
-    df = df[df["name"].str.strip() != ""]
+    df = df.dropna(subset=["name"]).loc[lambda d: d["name"].str.strip().str.len() > 0]
     after = len(df)
     logger.info(f"Removed {before - after} tracks without names")
     return df
 
 
 def extract_year_from_release_date(df: pd.DataFrame) -> pd.DataFrame:
-    def parse_year(date_str):
-        if pd.isna(date_str):
-            return None
-        date_str = str(date_str)
-        if len(date_str) >= 4:
-            try:
-                return int(date_str[:4])
-            except ValueError:
-                return None
-        return None
+    year_str = df["release_date"].astype("string").str.slice(0, 4)
+    year_str = year_str.where(year_str.str.fullmatch(r"\d{4}", na=False))
     
-    df["year"] = df["release_date"].apply(parse_year)
+    df["year"] = pd.to_numeric(year_str, errors="coerce").astype("Int16")
     missing = df["year"].isna().sum()
     logger.info(f"Extracted year from release_date, {missing} missing values")
     return df
@@ -77,10 +198,27 @@ def clean_artist_names(df: pd.DataFrame) -> pd.DataFrame:
                 pass
         return x_str.strip("[]'\"")
     
+    def clean_artist_column(column: pd.Series) -> pd.Series:
+        missing = column.isna()
+        values = column.astype(str)
+        
+        simple_list = values.str.fullmatch(SIMPLE_ARTIST_LIST_PATTERN) & ~missing
+        bracketed = values.str.startswith("[") & values.str.endswith("]") & ~simple_list & ~missing
+        
+        result = values.str.strip("[]'\"").astype(object)
+        result[simple_list] = (
+            values[simple_list]
+            .str.slice(2, -2)
+            .str.replace(r"['\"]\s*,\s*['\"]", ", ", regex=True)
+        )
+        result[bracketed] = values[bracketed].map(clean_artist)
+        result[missing] = "Unknown"
+        return result
+    
     if "artist_clean" in df.columns:
-        df["artist"] = df["artist_clean"].apply(clean_artist)
+        df["artist"] = clean_artist_column(df["artist_clean"])
     elif "artists" in df.columns:
-        df["artist"] = df["artists"].apply(clean_artist)
+        df["artist"] = clean_artist_column(df["artists"])
     else:
         df["artist"] = "Unknown"
     
@@ -88,12 +226,44 @@ def clean_artist_names(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def improve_language_detection(df: pd.DataFrame) -> pd.DataFrame:
-    import re
+def contains_any_keyword(values: pd.Series, keywords: List[str]) -> pd.Series:
+    unique_values = values.unique()
+    
+    if AHOCORASICK_AVAILABLE:
+        automaton = ahocorasick.Automaton()
+        for keyword in keywords:
+            automaton.add_word(keyword, keyword)
+        automaton.make_automaton()
+        hits = [next(automaton.iter(v), None) is not None for v in unique_values]
+    else:
+        import re
+        pattern = re.compile("|".join(map(re.escape, keywords)))
+        hits = [pattern.search(v) is not None for v in unique_values]
+    
+    return values.map(dict(zip(unique_values, hits))).astype(bool)
+
+
+def count_script_chars(values: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    unique_values, codes = np.unique(values.to_numpy(dtype=object), return_inverse=True)
+    lengths = np.fromiter((len(v) for v in unique_values), dtype=np.int64, count=len(unique_values))
+    
+    buffer = "".join(unique_values).encode("utf-32-le", errors="surrogatepass")
+    chars = np.frombuffer(buffer, dtype=np.uint32)
+    
+    cyrillic = ((chars >= 0x0410) & (chars <= 0x044F)) | (chars == 0x0401) | (chars == 0x0451)
+    latin = ((chars >= 0x41) & (chars <= 0x5A)) | ((chars >= 0x61) & (chars <= 0x7A))
+    
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
     
-    cyrillic_pattern = re.compile(r'[а-яА-ЯёЁ]')
-    latin_pattern = re.compile(r'[a-zA-Z]')
+    def per_value(mask: np.ndarray) -> np.ndarray:
+        cumulative = np.concatenate(([0], np.cumsum(mask, dtype=np.int64)))
+        return (cumulative[ends] - cumulative[starts])[codes]
     
+    return per_value(cyrillic), per_value(latin)
+
+
+def improve_language_detection(df: pd.DataFrame) -> pd.DataFrame:
     russian_artist_keywords = [
         "серёга", "серега", "кино", "цой", "дdt", "ддт", "грибы", "баста", 
         "тимати", "нюша", "егор крид", "макс корж", "хаски", "моргенштерн",
@@ -102,41 +272,28 @@ def improve_language_detection(df: pd.DataFrame) -> pd.DataFrame:
         "noize mc", "ленинград", "шнуров", "t-fest", "jah khalib"
     ]
     
-    def detect_language(row):
-        name = str(row.get("name", ""))
-        artist = str(row.get("artist", "")).lower()
-        current_lang = row.get("language", "other")
-        
-        if current_lang == "instrumental":
-            return "instrumental"
-        
-        cyrillic_in_name = len(cyrillic_pattern.findall(name))
-        latin_in_name = len(latin_pattern.findall(name))
-        
-        cyrillic_in_artist = len(cyrillic_pattern.findall(artist))
-        
-        is_russian_artist = any(kw in artist for kw in russian_artist_keywords)
-        
-        if cyrillic_in_name > 2:
-            return "ru"
-        
-        if is_russian_artist or cyrillic_in_artist > 2:
-            return "ru"
-        
-        if current_lang == "ru" and cyrillic_in_name == 0 and cyrillic_in_artist == 0:
-            if not is_russian_artist:
-                return "en"
-        
-        if latin_in_name > 2 and cyrillic_in_name == 0:
-            if current_lang == "other":
-                return "en"
-        
-        if current_lang and current_lang != "other":
-            return current_lang
-        
-        return "other"
+    name = df["name"].astype(str)
+    artist = df["artist"].astype(str).str.lower()
+    if "language" in df.columns:
+        current_lang = df["language"]
+    else:
+        current_lang = pd.Series("other", index=df.index, dtype=object)
+    
+    cyrillic_in_name, latin_in_name = count_script_chars(name)
+    cyrillic_in_artist, _ = count_script_chars(artist)
+    is_russian_artist = contains_any_keyword(artist, russian_artist_keywords)
+    
+    conditions = [
+        current_lang == "instrumental",
+        cyrillic_in_name > 2,
+        is_russian_artist | (cyrillic_in_artist > 2),
+        (current_lang == "ru") & (cyrillic_in_name == 0) & (cyrillic_in_artist == 0),
+        (latin_in_name > 2) & (cyrillic_in_name == 0) & (current_lang == "other"),
+    ]
+    choices = ["instrumental", "ru", "ru", "en", "en"]
+    fallback = current_lang.where(current_lang != "", "other").to_numpy(dtype=object)
     
-    df["language"] = df.apply(detect_language, axis=1)
+    df["language"] = np.select(conditions, choices, default=fallback)
     
     lang_counts = df["language"].value_counts()
     logger.info(f"Language distribution after improvement:\n{lang_counts}")
@@ -173,33 +330,25 @@ def enrich_with_spotify(df: pd.DataFrame, batch_size: int = 50, max_tracks: int
     else:
         tracks_to_process = missing_date.head(max_tracks)
         track_ids = tracks_to_process["spotify_id"].tolist()
-        enriched_count = 0
+        updates = {}
         
-        for i in range(0, len(track_ids), batch_size):
-            batch = track_ids[i:i+batch_size]
-            logger.info(f"Enriching dates: batch {i//batch_size + 1}/{(len(track_ids)-1)//batch_size + 1}")
-            
-            try:
-                tracks_data = sp.tracks(batch)
-                
-                for track in tracks_data["tracks"]:
-                    if track is None:
-                        continue
-                    
-                    track_id = track["id"]
-                    release_date = track["album"].get("release_date", "")
-                    
-                    if release_date:
-                        df.loc[df["spotify_id"] == track_id, "release_date"] = release_date
-                        enriched_count += 1
+        for tracks_data in fetch_in_batches(sp.tracks, track_ids, batch_size, "Enriching dates"):
+            for track in tracks_data["tracks"]:
+                if track is None:
+                    continue
                 
-                time.sleep(0.3)
+                track_id = track["id"]
+                release_date = track["album"].get("release_date", "")
                 
-            except Exception as e:
-                logger.error(f"Error processing batch: {e}")
-                time.sleep(2)
+                if release_date:
+                    updates[track_id] = release_date
         
-        logger.info(f"Enriched {enriched_count} tracks with release dates")
+        if updates:
+            release_dates = pd.Series(updates)
+            mask = df["spotify_id"].isin(release_dates.index)
+            df.loc[mask, "release_date"] = df.loc[mask, "spotify_id"].map(release_dates)
+        
+        logger.info(f"Enriched {len(updates)} tracks with release dates")
     
     return df
 
@@ -239,8 +388,11 @@ def enrich_genres_from_artists(df: pd.DataFrame, batch_size: int = 50, max_artis
             pass
         return []
     
-    df["genres_parsed"] = df["genres"].apply(parse_genres)
-    missing_genres = df[df["genres_parsed"].apply(len) == 0]
+    genres = df["genres"].astype("string").fillna("")
+    unique_genres = genres.unique()
+    has_genres = {value: len(parse_genres(value)) > 0 for value in unique_genres}
+    missing_mask = ~genres.map(has_genres).astype(bool)
+    missing_genres = df[missing_mask]
     
     if "artist_spotify_id" not in df.columns:
         logger.warning("No artist_spotify_id column, cannot enrich genres")
@@ -254,34 +406,33 @@ def enrich_genres_from_artists(df: pd.DataFrame, batch_size: int = 50, max_artis
     
     artist_genres_map = {}
     
-    for i in range(0, len(artist_ids), batch_size):
-        batch = list(artist_ids[i:i+batch_size])
-        logger.info(f"Fetching artist genres: batch {i//batch_size + 1}/{(len(artist_ids)-1)//batch_size + 1}")
+    with shelve.open(str(ARTIST_CACHE_PATH)) as cache:
+        to_fetch = []
+        for artist_id in artist_ids:
+            if artist_id in cache:
+                artist_genres_map[artist_id] = cache[artist_id]
+            else:
+                to_fetch.append(artist_id)
         
-        try:
-            artists_data = sp.artists(batch)
-            
+        logger.info(f"{len(artist_genres_map)} artists found in cache, fetching {len(to_fetch)}")
+        
+        for artists_data in fetch_in_batches(sp.artists, to_fetch, batch_size, "Fetching artist genres"):
             for artist in artists_data["artists"]:
                 if artist:
-                    artist_genres_map[artist["id"]] = artist.get("genres", [])
-            
-            time.sleep(0.3)
-            
-        except Exception as e:
-            logger.error(f"Error fetching artists: {e}")
-            time.sleep(2)
-    
-    enriched_count = 0
-    for artist_id, genres in artist_genres_map.items():
-        if genres:
-            mask = (df["artist_spotify_id"] == artist_id) & (df["genres_parsed"].apply(len) == 0)
-            df.loc[mask, "genres"] = str(genres)
-            enriched_count += mask.sum()
+                    genres = artist.get("genres", [])
+                    artist_genres_map[artist["id"]] = genres
+                    cache[artist["id"]] = genres
+    
+    genres_by_artist = pd.Series(
+        {artist_id: str(genres) for artist_id, genres in artist_genres_map.items() if genres},
+        dtype=object
+    )
+    mask = missing_mask & df["artist_spotify_id"].isin(genres_by_artist.index)
+    df.loc[mask, "genres"] = df.loc[mask, "artist_spotify_id"].map(genres_by_artist)
+    enriched_count = int(mask.sum())
     
     logger.info(f"Enriched {enriched_count} tracks with genres from artist data")
     
-    df = df.drop(columns=["genres_parsed"], errors="ignore")
-    
     return df
 
 
@@ -298,22 +449,33 @@ def filter_quality_tracks(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def save_dataset(df: pd.DataFrame):
-    OUTPUT_CSV.parent.mkdir(parents=True, exist_ok=True)
+def save_dataset(df: pd.DataFrame, as_csv: bool = False):
+    OUTPUT_PARQUET.parent.mkdir(parents=True, exist_ok=True)
     
-    columns_to_keep = [
-        "spotify_id", "name", "artist", "year", "release_date",
-        "genres", "language", "popularity", "explicit",
-        "valence", "energy", "danceability", "acousticness", 
-        "tempo", "instrumentalness", "liveness", "loudness",
-        "speechiness", "duration_ms", "mode", "key"
-    ]
-    
-    available_columns = [c for c in columns_to_keep if c in df.columns]
+    available_columns = [c for c in OUTPUT_COLUMNS if c in df.columns]
     df_out = df[available_columns].copy()
     
-    df_out.to_csv(OUTPUT_CSV, index=False, encoding="utf-8-sig")
-    logger.info(f"Saved cleaned dataset to {OUTPUT_CSV}")
+    float_columns = [c for c in FLOAT_COLUMNS if c in df_out.columns]
+    df_out[float_columns] = df_out[float_columns].astype("float32")
+    
+    if as_csv:
+        df_out.to_csv(OUTPUT_CSV, index=False, encoding="utf-8-sig")
+        logger.info(f"Saved cleaned dataset to {OUTPUT_CSV}")
+    
+    df_out.to_parquet(
+        OUTPUT_PARQUET,
+        engine="pyarrow",
+        compression="zstd",
+        row_group_size=100_000,
+        index=False
+    )
+    logger.info(f"Saved cleaned dataset to {OUTPUT_PARQUET}")
+    
+    table = pa.Table.from_pandas(df_out, preserve_index=False)
+    with pa.ipc.new_file(str(OUTPUT_FEATHER), table.schema) as writer:
+        writer.write_table(table)
+    logger.info(f"Saved cleaned dataset to {OUTPUT_FEATHER}")
+    
     logger.info(f"Final dataset: {len(df_out)} tracks, {len(available_columns)} columns")
 
 
@@ -328,17 +490,24 @@ def print_statistics(df: pd.DataFrame):
     if "year" in df.columns and df["year"].notna().any():
         print(f"  Min: {df['year'].min()}, Max: {df['year'].max()}")
     print(f"\nПропущенные значения:")
-    print(df.isnull().sum()[df.isnull().sum() > 0])
+    nulls = df.isna().sum()
+    print(nulls[nulls > 0])
 
 
 def main():
-    df = load_dataset()
+    seen_ids = set()
+    chunks = []
+    
+    for chunk in load_dataset_chunks():
+        chunk = remove_duplicates(chunk, seen_ids)
+        chunk = remove_empty_names(chunk)
+        chunk = extract_year_from_release_date(chunk)
+        chunk = clean_artist_names(chunk)
+        chunk = improve_language_detection(chunk)
+        chunks.append(chunk[[c for c in WORKING_COLUMNS if c in chunk.columns]])
     
-    df = remove_duplicates(df)
-    df = remove_empty_names(df)
-    df = extract_year_from_release_date(df)
-    df = clean_artist_names(df)
-    df = improve_language_detection(df)
+    df = pd.concat(chunks, ignore_index=True)
+    logger.info(f"Processed {len(df)} tracks")
     
     if "--enrich" in sys.argv:
         df = enrich_with_spotify(df)
@@ -347,7 +516,7 @@ def main():
     if "--filter-quality" in sys.argv:
         df = filter_quality_tracks(df)
     
-    save_dataset(df)
+    save_dataset(df, as_csv="--csv" in sys.argv)
     print_statistics(df)
 
 
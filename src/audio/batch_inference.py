@@ -0,0 +1,111 @@
+import queue
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from config.settings import settings
+from .emotion import AudioEmotionClassifier, AudioEmotionResult, get_emotion_classifier
+
+logger = logging.getLogger(__name__)
+
+_Request = Tuple[np.ndarray, int, Future]
+
+
+class EmotionBatcher:
+    """Собирает одновременные запросы на классификацию эмоций в один батч HuBERT."""
+    
+    def __init__(
+        self,
+        classifier: Optional[AudioEmotionClassifier] = None,
+        batch_size: Optional[int] = None,
+        window_ms: Optional[int] = None,
+        max_pending: int = 64
+    ):
+        self.classifier = classifier or get_emotion_classifier()
+        self.batch_size = max(1, batch_size or settings.emotion_batch_size)
+        self.window_sec = (window_ms if window_ms is not None else settings.emotion_batch_window_ms) / 1000
+        self._queue: "queue.Queue[_Request]" = queue.Queue(maxsize=max_pending)
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+    
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run,
+                    name="emotion-batcher",
+                    daemon=True
+                )
+                self._worker.start()
+    
+    def submit(self, audio: np.ndarray, sampling_rate: int = 16000) -> Future:
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((audio, sampling_rate, future))
+        return future
+    
+    def classify(self, audio: np.ndarray, sampling_rate: int = 16000) -> AudioEmotionResult:
+        if self.batch_size == 1:
+            return self.classifier.classify(audio, sampling_rate)
+        return self.submit(audio, sampling_rate).result()
+    
+    def _collect_batch(self) -> List[_Request]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window_sec
+        
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        
+        return batch
+    
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            
+            by_rate = {}
+            for request in batch:
+                by_rate.setdefault(request[1], []).append(request)
+            
+            for sampling_rate, requests in by_rate.items():
+                self._process(sampling_rate, requests)
+    
+    def _process(self, sampling_rate: int, requests: List[_Request]):
+        try:
+            results = self.classifier.classify_batch(
+                [audio for audio, _, _ in requests],
+                sampling_rate
+            )
+        except Exception as e:
+            logger.error("Emotion batch of %d failed: %s", len(requests), e)
+            for _, _, future in requests:
+                future.set_exception(e)
+            return
+        
+        for (_, _, future), result in zip(requests, results):
+            future.set_result(result)
+
+
+_batcher_instance: Optional[EmotionBatcher] = None
+_batcher_lock = threading.Lock()
+
+
+def get_emotion_batcher() -> EmotionBatcher:
+    global _batcher_instance
+    if _batcher_instance is None:
+        with _batcher_lock:
+            if _batcher_instance is None:
+                _batcher_instance = EmotionBatcher()
+    return _batcher_instance
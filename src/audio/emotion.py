@@ -1,5 +1,6 @@
+import threading
 from dataclasses import dataclass
-from typing import Optional
+from typing import List, Optional
 import numpy as np
 
 
@@ -81,23 +82,50 @@ EMOTION_MUSIC_PROFILES = {
 }
 
 
+PROFILE_FEATURES = ("valence", "energy", "danceability", "tempo")
+EMOTION_INDEX = {emotion: i for i, emotion in enumerate(EMOTION_MUSIC_PROFILES)}
+PROFILE_ARRAY = np.array(
+    [[profile[feature] for feature in PROFILE_FEATURES] for profile in EMOTION_MUSIC_PROFILES.values()],
+    dtype=np.float64
+)
+PROFILE_ARRAY.setflags(write=False)
+PROFILE_MIDPOINTS = {
+    emotion: dict(zip(PROFILE_FEATURES, PROFILE_ARRAY[i].mean(axis=1).tolist()))
+    for emotion, i in EMOTION_INDEX.items()
+}
+
+EMOTION_MODEL_NAME = "superb/hubert-large-superb-er"
+
+
 class AudioEmotionClassifier:
-    def __init__(self):
+    def __init__(self, model_name: str = EMOTION_MODEL_NAME):
+        self.model_name = model_name
         self._model = None
+        self._feature_extractor = None
+        self._device = "cpu"
+        self._dtype = None
+        self._lock = threading.Lock()
     
     def _load_model(self):
-        if self._model is None:
-            from transformers import pipeline
-            self._model = pipeline(
-                "audio-classification",
-                model="superb/hubert-large-superb-er"
-            )
+        if self._model is not None:
+            return self._model
+        
+        with self._lock:
+            if self._model is None:
+                import torch
+                from transformers import AutoFeatureExtractor, AutoModelForAudioClassification
+                
+                self._device = "cuda" if torch.cuda.is_available() else "cpu"
+                self._dtype = torch.float16 if self._device == "cuda" else torch.float32
+                self._feature_extractor = AutoFeatureExtractor.from_pretrained(self.model_name)
+                self._model = AutoModelForAudioClassification.from_pretrained(
+                    self.model_name,
+                    torch_dtype=self._dtype
+                ).to(self._device).eval()
         return self._model
     
-    def classify(self, audio: np.ndarray, sampling_rate: int = 16000) -> AudioEmotionResult:
-        model = self._load_model()
-        results = model({"array": audio, "sampling_rate": sampling_rate})
-        
+    @staticmethod
+    def _to_result(results: List[dict]) -> AudioEmotionResult:
         all_emotions = {}
         for r in results:
             raw_label = r["label"]
@@ -119,9 +147,48 @@ class AudioEmotionClassifier:
             all_emotions=all_emotions
         )
     
+    def _predict(self, audios: List[np.ndarray], sampling_rate: int) -> List[List[dict]]:
+        import torch
+        
+        model = self._load_model()
+        inputs = self._feature_extractor(
+            audios,
+            sampling_rate=sampling_rate,
+            padding=True,
+            return_tensors="pt"
+        )
+        inputs = {
+            key: value.to(self._device, self._dtype) if value.is_floating_point() else value.to(self._device)
+            for key, value in inputs.items()
+        }
+        
+        with torch.inference_mode():
+            logits = model(**inputs).logits
+        
+        probs = logits.float().softmax(dim=-1).cpu().numpy()
+        id2label = model.config.id2label
+        
+        return [
+            [{"label": id2label[i], "score": float(row[i])} for i in np.argsort(row)[::-1]]
+            for row in probs
+        ]
+    
+    def classify(self, audio: np.ndarray, sampling_rate: int = 16000) -> AudioEmotionResult:
+        return self._to_result(self._predict([audio], sampling_rate)[0])
+    
+    def classify_batch(self, audios: List[np.ndarray], sampling_rate: int = 16000) -> List[AudioEmotionResult]:
+        if not audios:
+            return []
+        
+        return [self._to_result(results) for results in self._predict(audios, sampling_rate)]
+    
     @staticmethod
     def get_music_profile(emotion: str) -> dict:
         return EMOTION_MUSIC_PROFILES.get(emotion, EMOTION_MUSIC_PROFILES["neutral"])
+    
+    @staticmethod
+    def get_music_profile_vec(emotion: str) -> np.ndarray:
+        return PROFILE_ARRAY[EMOTION_INDEX.get(emotion, EMOTION_INDEX["neutral"])]
 
 
 _classifier_instance: Optional[AudioEmotionClassifier] = None
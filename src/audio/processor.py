@@ -1,14 +1,28 @@
+import io
 import os
 import tempfile
+import threading
 from dataclasses import dataclass, field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Union, BinaryIO
 
 import librosa
 import numpy as np
-import soundfile as sf
 
+from config.settings import settings
 from .validation import validate_audio, normalize_audio, ValidationResult
 from .emotion import AudioEmotionClassifier, AudioEmotionResult, get_emotion_classifier
+from .batch_inference import EmotionBatcher, get_emotion_batcher
+from .vad import get_vad
+
+try:
+    from faster_whisper import WhisperModel
+    FASTER_WHISPER_AVAILABLE = True
+except ImportError:
+    FASTER_WHISPER_AVAILABLE = False
+
+WHISPER_SAMPLE_RATE = 16000
+MIN_VOICED_DURATION = 1.0
+MIN_SPEECH_DURATION = 0.5
 
 
 @dataclass
@@ -37,16 +51,51 @@ class AudioProcessingResult:
 
 
 class AudioProcessor:
-    def __init__(self, whisper_model_size: str = "small", target_sr: int = 16000):
+    def __init__(self, whisper_model_size: Optional[str] = None, target_sr: int = 16000):
         self.target_sr = target_sr
-        self.whisper_model_size = whisper_model_size
+        self.whisper_model_size = whisper_model_size or settings.whisper_model_size
         self._whisper_model = None
+        self._whisper_device = "cpu"
+        self._whisper_lock = threading.Lock()
         self._emotion_classifier = None
+        self._emotion_batcher = None
+    
+    @staticmethod
+    def _resolve_device() -> str:
+        if settings.whisper_device != "auto":
+            return settings.whisper_device
+        try:
+            import torch
+            return "cuda" if torch.cuda.is_available() else "cpu"
+        except ImportError:
+            return "cpu"
     
     def _load_whisper(self):
-        if self._whisper_model is None:
-            import whisper
-            self._whisper_model = whisper.load_model(self.whisper_model_size)
+        if self._whisper_model is not None:
+            return self._whisper_model
+        
+        with self._whisper_lock:
+            if self._whisper_model is not None:
+                return self._whisper_model
+            
+            device = self._resolve_device()
+            self._whisper_device = device
+            
+            if FASTER_WHISPER_AVAILABLE:
+                compute_type = settings.whisper_compute_type or ("int8_float16" if device == "cuda" else "int8")
+                self._whisper_model = WhisperModel(
+                    self.whisper_model_size,
+                    device=device,
+                    compute_type=compute_type,
+                    cpu_threads=os.cpu_count() or 0
+                )
+            else:
+                import whisper
+                model = whisper.load_model(self.whisper_model_size, device=device)
+                if device == "cpu" and settings.whisper_compute_type in ("", "int8"):
+                    import torch
+                    model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+                self._whisper_model = model
         return self._whisper_model
     
     def _get_emotion_classifier(self) -> AudioEmotionClassifier:
@@ -54,13 +103,31 @@ class AudioProcessor:
             self._emotion_classifier = get_emotion_classifier()
         return self._emotion_classifier
     
+    def _get_emotion_batcher(self) -> EmotionBatcher:
+        if self._emotion_batcher is None:
+            self._emotion_batcher = get_emotion_batcher()
+        return self._emotion_batcher
+    
     def load_audio(self, audio_path: str) -> tuple[np.ndarray, int]:
         audio, sr = librosa.load(audio_path, sr=self.target_sr)
         return audio, sr
     
-    def load_audio_from_bytes(self, audio_bytes: bytes, format: str = "ogg") -> tuple[np.ndarray, int]:
+    def load_audio_from_bytes(
+        self,
+        audio_bytes: Union[bytes, BinaryIO],
+        format: str = "ogg"
+    ) -> tuple[np.ndarray, int]:
+        buffer = io.BytesIO(audio_bytes) if isinstance(audio_bytes, (bytes, bytearray, memoryview)) else audio_bytes
+        
+        try:
+            buffer.seek(0)
+            return librosa.load(buffer, sr=self.target_sr)
+        except Exception:
+            pass
+        
+        buffer.seek(0)
         with tempfile.NamedTemporaryFile(suffix=f".{format}", delete=False) as f:
-            f.write(audio_bytes)
+            f.write(buffer.read())
             temp_path = f.name
         
         try:
@@ -71,29 +138,39 @@ class AudioProcessor:
     
     def transcribe(self, audio: np.ndarray, sr: int, language: str = "ru") -> str:
         whisper_model = self._load_whisper()
-        audio_norm = normalize_audio(audio)
         
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as f:
-            sf.write(f.name, audio_norm, sr)
-            temp_path = f.name
+        if sr != WHISPER_SAMPLE_RATE:
+            audio = librosa.resample(audio, orig_sr=sr, target_sr=WHISPER_SAMPLE_RATE)
+        audio_norm = normalize_audio(audio).astype(np.float32, copy=False)
         
-        try:
-            result = whisper_model.transcribe(
-                temp_path,
+        if FASTER_WHISPER_AVAILABLE:
+            segments, _ = whisper_model.transcribe(
+                audio_norm,
                 language=language,
                 task="transcribe",
+                beam_size=1,
+                vad_filter=True,
                 condition_on_previous_text=False,
                 temperature=0.0,
                 no_speech_threshold=0.3
             )
-            return result["text"].strip()
-        finally:
-            os.unlink(temp_path)
+            return "".join(s.text for s in segments).strip()
+        
+        result = whisper_model.transcribe(
+            audio_norm,
+            language=language,
+            task="transcribe",
+            condition_on_previous_text=False,
+            temperature=0.0,
+            no_speech_threshold=0.3,
+            fp16=self._whisper_device == "cuda"
+        )
+        return result["text"].strip()
     
     def process(
         self, 
         audio_path: str = None,
-        audio_bytes: bytes = None,
+        audio_bytes: Union[bytes, BinaryIO] = None,
         audio_format: str = "ogg",
         language: str = "ru"
     ) -> AudioProcessingResult:
@@ -116,10 +193,35 @@ class AudioProcessor:
                     duration=duration
                 )
             
-            emotion_classifier = self._get_emotion_classifier()
-            emotion_result = emotion_classifier.classify(audio, sr)
+            voiced_sec = validation.details["voiced_sec"]
+            if settings.use_silero_vad:
+                speech_sec = get_vad().speech_duration(audio, sr)
+                if speech_sec is not None:
+                    voiced_sec = validation.details["speech_sec"] = round(speech_sec, 2)
+                    if speech_sec < MIN_SPEECH_DURATION:
+                        return AudioProcessingResult(
+                            status="invalid_audio",
+                            reason="silence",
+                            validation_details=validation.details,
+                            duration=duration
+                        )
+            
+            emotion_future = self._get_emotion_batcher().submit(audio, sr)
+            
+            if voiced_sec < MIN_VOICED_DURATION:
+                emotion_result = emotion_future.result()
+                return AudioProcessingResult(
+                    status="invalid_audio",
+                    reason="no_speech",
+                    emotion=emotion_result.emotion,
+                    emotion_confidence=emotion_result.confidence,
+                    all_emotions=emotion_result.all_emotions,
+                    validation_details=validation.details,
+                    duration=duration
+                )
             
             transcript = self.transcribe(audio, sr, language)
+            emotion_result = emotion_future.result()
             
             if len(transcript.split()) < 2:
                 return AudioProcessingResult(
@@ -149,10 +251,13 @@ class AudioProcessor:
 
 
 _processor_instance: Optional[AudioProcessor] = None
+_processor_lock = threading.Lock()
 
 
-def get_audio_processor(whisper_model_size: str = "small") -> AudioProcessor:
+def get_audio_processor(whisper_model_size: Optional[str] = None) -> AudioProcessor:
     global _processor_instance
     if _processor_instance is None:
-        _processor_instance = AudioProcessor(whisper_model_size=whisper_model_size)
+        with _processor_lock:
+            if _processor_instance is None:
+                _processor_instance = AudioProcessor(whisper_model_size=whisper_model_size)
     return _processor_instance
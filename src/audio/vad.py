@@ -0,0 +1,62 @@
+import logging
+import threading
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+VAD_SAMPLE_RATES = (8000, 16000)
+
+
+class SileroVAD:
+    def __init__(self, repo: str = "snakers4/silero-vad"):
+        self.repo = repo
+        self._model = None
+        self._get_speech_timestamps = None
+        self._failed = False
+        self._lock = threading.Lock()
+    
+    def _load_model(self):
+        if self._model is not None or self._failed:
+            return self._model
+        
+        with self._lock:
+            if self._model is None and not self._failed:
+                try:
+                    import torch
+                    
+                    model, utils = torch.hub.load(self.repo, "silero_vad", trust_repo=True)
+                    self._get_speech_timestamps = utils[0]
+                    self._model = model
+                except Exception as e:
+                    logger.warning("Silero VAD unavailable, falling back to RMS: %s", e)
+                    self._failed = True
+        return self._model
+    
+    def speech_duration(self, audio: np.ndarray, sr: int) -> Optional[float]:
+        if sr not in VAD_SAMPLE_RATES or self._load_model() is None:
+            return None
+        
+        import torch
+        
+        with self._lock:
+            timestamps = self._get_speech_timestamps(
+                torch.from_numpy(np.ascontiguousarray(audio, dtype=np.float32)),
+                self._model,
+                sampling_rate=sr
+            )
+        return sum(t["end"] - t["start"] for t in timestamps) / sr
+
+
+_vad_instance: Optional[SileroVAD] = None
+_vad_lock = threading.Lock()
+
+
+def get_vad() -> SileroVAD:
+    global _vad_instance
+    if _vad_instance is None:
+        with _vad_lock:
+            if _vad_instance is None:
+                _vad_instance = SileroVAD()
+    return _vad_instance
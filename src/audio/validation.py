@@ -1,7 +1,7 @@
 import librosa
 import numpy as np
 from dataclasses import dataclass
-from typing import Tuple
+from typing import Tuple, Optional
 
 
 @dataclass
@@ -15,8 +15,14 @@ class ValidationResult:
             self.details = {}
 
 
-def is_silent(audio: np.ndarray, threshold: float = 0.003, min_ratio: float = 0.05) -> bool:
-    rms = librosa.feature.rms(y=audio)[0]
+def is_silent(
+    audio: np.ndarray,
+    threshold: float = 0.003,
+    min_ratio: float = 0.05,
+    rms: Optional[np.ndarray] = None
+) -> bool:
+    if rms is None:
+        rms = librosa.feature.rms(y=audio)[0]
     speech_ratio = (rms > threshold).mean()
     return speech_ratio < min_ratio
 
@@ -25,8 +31,21 @@ def is_too_short(audio: np.ndarray, sr: int, min_duration: float = 1.0) -> bool:
     return len(audio) / sr < min_duration
 
 
-def is_noisy(audio: np.ndarray, threshold: float = 0.4) -> bool:
-    zcr = librosa.feature.zero_crossing_rate(audio)
+def voiced_duration(
+    audio: np.ndarray,
+    sr: int,
+    threshold: float = 0.003,
+    hop_length: int = 512,
+    rms: Optional[np.ndarray] = None
+) -> float:
+    if rms is None:
+        rms = librosa.feature.rms(y=audio, hop_length=hop_length)[0]
+    return float((rms > threshold).sum()) * hop_length / sr
+
+
+def is_noisy(audio: np.ndarray, threshold: float = 0.4, zcr: Optional[np.ndarray] = None) -> bool:
+    if zcr is None:
+        zcr = librosa.feature.zero_crossing_rate(audio)
     return zcr.mean() > threshold
 
 
@@ -40,22 +59,25 @@ def validate_audio(audio: np.ndarray, sr: int) -> ValidationResult:
         "rms_mean": round(rms.mean(), 4),
         "rms_max": round(rms.max(), 4),
         "zcr_mean": round(zcr.mean(), 4),
+        "voiced_sec": round(voiced_duration(audio, sr, rms=rms), 2),
     }
     
-    if is_silent(audio):
+    if is_silent(audio, rms=rms):
         return ValidationResult(is_valid=False, reason="silence", details=details)
     
     if is_too_short(audio, sr):
         return ValidationResult(is_valid=False, reason="too_short", details=details)
     
-    if is_noisy(audio):
+    if is_noisy(audio, zcr=zcr):
         return ValidationResult(is_valid=False, reason="too_noisy", details=details)
     
     return ValidationResult(is_valid=True, reason="ok", details=details)
 
 
 def normalize_audio(audio: np.ndarray, target_rms: float = 0.1) -> np.ndarray:
-    rms = np.sqrt(np.mean(audio ** 2))
+    if audio.size == 0:
+        return audio
+    rms = np.sqrt(np.dot(audio, audio) / audio.size)
     if rms == 0:
         return audio
-    return audio * (target_rms / rms)
+    return audio * audio.dtype.type(target_rms / rms)
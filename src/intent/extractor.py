@@ -1,6 +1,16 @@
 import re
+import unicodedata
+from itertools import islice
 from dataclasses import dataclass, field
-from typing import List, Optional
+from typing import Dict, List, Optional, Set
+
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+_TOKEN_RE = re.compile(r"\w+")
 
 
 @dataclass
@@ -33,26 +43,26 @@ class UserIntent:
 
 
 GENRE_KEYWORDS = {
-    "pop": {"pop", "поп", "попс"},
-    "dance": {"dance", "танц", "дэнс"},
-    "electronic": {"electronic", "edm", "house", "techno", "trance", "электрон", "хаус", "техно", "транс"},
-    "indie": {"indie", "инди"},
-    "hip_hop": {"hip", "hop", "хип", "хоп"},
-    "rap": {"rap", "рэп", "реп", "рэпчик"},
-    "trap": {"trap", "трэп", "треп"},
-    "rnb": {"rnb", "r&b", "рнб", "ритм"},
-    "rock": {"rock", "рок"},
-    "metal": {"metal", "метал", "металл"},
-    "punk": {"punk", "панк"},
-    "alternative": {"alternative", "альтернатив", "альт"},
-    "classical": {"classical", "классик", "symphon", "orchestr", "оркест", "симфон"},
-    "instrumental": {"instrumental", "инструмент", "piano", "пиан", "фортепиано"},
-    "ambient": {"ambient", "эмбиент", "амбиент"},
-    "jazz": {"jazz", "джаз"},
-    "folk": {"folk", "фолк", "народн"},
-    "latin": {"latin", "латино", "регетон", "reggaeton"},
-    "soundtrack": {"soundtrack", "саундтрек", "score", "кино", "фильм"},
-    "blues": {"blues", "блюз"},
+    "pop": frozenset({"pop", "поп", "попс"}),
+    "dance": frozenset({"dance", "танц", "дэнс"}),
+    "electronic": frozenset({"electronic", "edm", "house", "techno", "trance", "электрон", "хаус", "техно", "транс"}),
+    "indie": frozenset({"indie", "инди"}),
+    "hip_hop": frozenset({"hip", "hop", "хип", "хоп"}),
+    "rap": frozenset({"rap", "рэп", "реп", "рэпчик"}),
+    "trap": frozenset({"trap", "трэп", "треп"}),
+    "rnb": frozenset({"rnb", "r&b", "рнб", "ритм"}),
+    "rock": frozenset({"rock", "рок"}),
+    "metal": frozenset({"metal", "метал", "металл"}),
+    "punk": frozenset({"punk", "панк"}),
+    "alternative": frozenset({"alternative", "альтернатив", "альт"}),
+    "classical": frozenset({"classical", "классик", "symphon", "orchestr", "оркест", "симфон"}),
+    "instrumental": frozenset({"instrumental", "инструмент", "piano", "пиан", "фортепиано"}),
+    "ambient": frozenset({"ambient", "эмбиент", "амбиент"}),
+    "jazz": frozenset({"jazz", "джаз"}),
+    "folk": frozenset({"folk", "фолк", "народн"}),
+    "latin": frozenset({"latin", "латино", "регетон", "reggaeton"}),
+    "soundtrack": frozenset({"soundtrack", "саундтрек", "score", "кино", "фильм"}),
+    "blues": frozenset({"blues", "блюз"}),
 }
 
 LANGUAGE_KEYWORDS = {
@@ -72,11 +82,55 @@ MOOD_KEYWORDS = {
     "party": ["вечеринк", "тусовк", "клуб", "танцпол", "пати", "движ"],
 }
 
-PLAY_KEYWORDS = {
+PLAY_KEYWORDS = frozenset({
     "включи", "поставь", "запусти", "проиграй", "воспроизведи",
     "хочу", "давай", "дай", "найди", "подбери", "порекомендуй",
     "play", "start", "put"
-}
+})
+
+STOP_WORDS = frozenset({
+    "я", "ты", "мы", "вы", "он", "она", "они", "оно", "что", "как", 
+    "это", "тот", "такой", "такая", "такие", "мне", "мой", "моя", "мои",
+    "тебе", "твой", "хочу", "хочется", "нужно", "нужна", "можно", "можешь",
+    "давай", "дай", "включи", "поставь", "послушать", "слушать", "музык",
+    "песн", "трек", "что", "нибудь", "какой", "какую", "какие", "очень",
+    "немного", "чуть", "просто", "сейчас", "сегодня", "вчера", "потом",
+    "ещё", "еще", "только", "уже", "тоже", "также", "или", "либо", "а", "и",
+    "но", "да", "нет", "не", "под", "на", "в", "к", "от", "для", "с", "по",
+})
+
+
+LANGUAGE_PRIORITY = ("instrumental", "ru", "en")
+
+
+class KeywordMatcher:
+    def __init__(self, tables: Dict[str, Dict[str, List[str]]]):
+        self._patterns: Dict[str, List[tuple]] = {}
+        for kind, table in tables.items():
+            for label, keywords in table.items():
+                for kw in keywords:
+                    self._patterns.setdefault(kw, []).append((kind, label))
+        
+        self._automaton = None
+        if AHOCORASICK_AVAILABLE:
+            self._automaton = ahocorasick.Automaton()
+            for kw, targets in self._patterns.items():
+                self._automaton.add_word(kw, targets)
+            self._automaton.make_automaton()
+    
+    def scan(self, text_lower: str) -> Dict[str, Set[str]]:
+        buckets: Dict[str, Set[str]] = {}
+        
+        if self._automaton is not None:
+            hits = (targets for _, targets in self._automaton.iter(text_lower))
+        else:
+            hits = (targets for kw, targets in self._patterns.items() if kw in text_lower)
+        
+        for targets in hits:
+            for kind, label in targets:
+                buckets.setdefault(kind, set()).add(label)
+        
+        return buckets
 
 
 class IntentExtractor:
@@ -85,76 +139,60 @@ class IntentExtractor:
         self.language_keywords = LANGUAGE_KEYWORDS
         self.mood_keywords = MOOD_KEYWORDS
         self.play_keywords = PLAY_KEYWORDS
+        self._matcher = KeywordMatcher({
+            "genre": {
+                genre: [kw for kw in keywords if _TOKEN_RE.fullmatch(kw)]
+                for genre, keywords in self.genre_keywords.items()
+            },
+            "language": self.language_keywords,
+            "mood": self.mood_keywords,
+        })
     
     @staticmethod
-    def tokenize(text: str) -> List[str]:
-        return re.findall(r"\w+", text.lower())
+    def normalize(text: str) -> str:
+        return unicodedata.normalize("NFKC", text).lower()
     
-    def extract_genres(self, text: str) -> List[str]:
-        tokens = self.tokenize(text)
-        found_genres = set()
-        
-        for genre, keywords in self.genre_keywords.items():
-            for token in tokens:
-                for kw in keywords:
-                    if token.startswith(kw) or kw in token:
-                        found_genres.add(genre)
-                        break
-        
-        return list(found_genres)
+    @classmethod
+    def tokenize(cls, text: str, text_lower: Optional[str] = None) -> List[str]:
+        return _TOKEN_RE.findall(text_lower if text_lower is not None else cls.normalize(text))
     
-    def extract_language(self, text: str) -> Optional[str]:
-        text_lower = text.lower()
-        
-        for kw in self.language_keywords["instrumental"]:
-            if kw in text_lower:
-                return "instrumental"
-        
-        for kw in self.language_keywords["ru"]:
-            if kw in text_lower:
-                return "ru"
-        
-        for kw in self.language_keywords["en"]:
-            if kw in text_lower:
-                return "en"
-        
-        return None
+    def _genres_from(self, found: Dict[str, Set[str]]) -> List[str]:
+        genres = found.get("genre", set())
+        return [genre for genre in self.genre_keywords if genre in genres]
     
-    def extract_mood(self, text: str) -> List[str]:
-        text_lower = text.lower()
-        found_moods = []
-        
-        for mood, keywords in self.mood_keywords.items():
-            for kw in keywords:
-                if kw in text_lower:
-                    found_moods.append(mood)
-                    break
-        
-        return found_moods
-    
-    def extract_play_intent(self, text: str) -> bool:
-        tokens = self.tokenize(text)
-        return any(token in self.play_keywords for token in tokens)
-    
-    def extract_keywords(self, text: str) -> List[str]:
-        tokens = self.tokenize(text)
-        stop_words = {
-            "я", "ты", "мы", "вы", "он", "она", "они", "оно", "что", "как", 
-            "это", "тот", "такой", "такая", "такие", "мне", "мой", "моя", "мои",
-            "тебе", "твой", "хочу", "хочется", "нужно", "нужна", "можно", "можешь",
-            "давай", "дай", "включи", "поставь", "послушать", "слушать", "музык",
-            "песн", "трек", "что", "нибудь", "какой", "какую", "какие", "очень",
-            "немного", "чуть", "просто", "сейчас", "сегодня", "вчера", "потом",
-            "ещё", "еще", "только", "уже", "тоже", "также", "или", "либо", "а", "и",
-            "но", "да", "нет", "не", "под", "на", "в", "к", "от", "для", "с", "по",
-        }
-        
-        keywords = []
-        for token in tokens:
-            if len(token) >= 3 and token not in stop_words:
-                keywords.append(token)
-        
-        return keywords[:5]
+    @staticmethod
+    def _language_from(found: Dict[str, Set[str]]) -> Optional[str]:
+        languages = found.get("language", set())
+        return next((language for language in LANGUAGE_PRIORITY if language in languages), None)
+    
+    def _mood_from(self, found: Dict[str, Set[str]]) -> List[str]:
+        moods = found.get("mood", set())
+        return [mood for mood in self.mood_keywords if mood in moods]
+    
+    def _play_intent_from(self, tokens: List[str]) -> bool:
+        return not self.play_keywords.isdisjoint(tokens)
+    
+    @staticmethod
+    def _keywords_from(tokens: List[str]) -> List[str]:
+        return list(islice((token for token in tokens if len(token) >= 3 and token not in STOP_WORDS), 5))
+    
+    def _scan(self, text: str, text_lower: Optional[str]) -> Dict[str, Set[str]]:
+        return self._matcher.scan(text_lower if text_lower is not None else self.normalize(text))
+    
+    def extract_genres(self, text: str, text_lower: Optional[str] = None) -> List[str]:
+        return self._genres_from(self._scan(text, text_lower))
+    
+    def extract_language(self, text: str, text_lower: Optional[str] = None) -> Optional[str]:
+        return self._language_from(self._scan(text, text_lower))
+    
+    def extract_mood(self, text: str, text_lower: Optional[str] = None) -> List[str]:
+        return self._mood_from(self._scan(text, text_lower))
+    
+    def extract_play_intent(self, text: str, text_lower: Optional[str] = None) -> bool:
+        return self._play_intent_from(self.tokenize(text, text_lower))
+    
+    def extract_keywords(self, text: str, text_lower: Optional[str] = None) -> List[str]:
+        return self._keywords_from(self.tokenize(text, text_lower))
     
     def extract(
         self, 
@@ -169,16 +207,20 @@ class IntentExtractor:
                 transcript=""
             )
         
+        text_lower = self.normalize(text)
+        tokens = self.tokenize(text, text_lower)
+        found = self._matcher.scan(text_lower)
+        
         return UserIntent(
             audio_emotion=audio_emotion,
             audio_emotion_confidence=audio_emotion_confidence,
-            language=self.extract_language(text),
-            genres=self.extract_genres(text),
-            mood_keywords=self.extract_mood(text),
-            play_intent=self.extract_play_intent(text),
+            language=self._language_from(found),
+            genres=self._genres_from(found),
+            mood_keywords=self._mood_from(found),
+            play_intent=self._play_intent_from(tokens),
             transcript=text.strip(),
             artist=None,
-            keywords=self.extract_keywords(text)
+            keywords=self._keywords_from(tokens)
         )
 
 
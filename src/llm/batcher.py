@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import weakref
+from typing import Any, Dict, List, Optional, Tuple
+
+from config.settings import settings
+from src.intent.extractor import UserIntent
+from .gigachat import GigaChatService, get_gigachat_service
+
+logger = logging.getLogger(__name__)
+
+_Request = Tuple[UserIntent, asyncio.Future]
+
+
+class LLMBatcher:
+    """Собирает одновременные запросы анализа GigaChat в один батч."""
+    
+    def __init__(
+        self,
+        service: Optional[GigaChatService] = None,
+        max_batch: Optional[int] = None,
+        flush_ms: Optional[int] = None
+    ):
+        self.service = service or get_gigachat_service()
+        self.max_batch = max(1, max_batch or settings.llm_batch_size)
+        self.window_sec = (flush_ms if flush_ms is not None else settings.llm_batch_window_ms) / 1000
+        self._queues = weakref.WeakKeyDictionary()
+        self._workers = weakref.WeakKeyDictionary()
+        self._tasks = set()
+    
+    def _get_queue(self) -> "asyncio.Queue[_Request]":
+        loop = asyncio.get_running_loop()
+        request_queue = self._queues.get(loop)
+        if request_queue is None:
+            request_queue = self._queues[loop] = asyncio.Queue()
+        
+        worker = self._workers.get(loop)
+        if worker is None or worker.done():
+            self._workers[loop] = loop.create_task(self._run(request_queue))
+        return request_queue
+    
+    async def submit(self, intent: UserIntent) -> Dict[str, Any]:
+        if self.max_batch == 1:
+            return await self.service.aanalyze_music_request(intent)
+        
+        future = asyncio.get_running_loop().create_future()
+        self._get_queue().put_nowait((intent, future))
+        return await future
+    
+    async def _collect_batch(self, request_queue: "asyncio.Queue[_Request]") -> List[_Request]:
+        batch = [await request_queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.window_sec
+        
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(request_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        
+        return batch
+    
+    async def _run(self, request_queue: "asyncio.Queue[_Request]"):
+        while True:
+            batch = [request for request in await self._collect_batch(request_queue) if not request[1].done()]
+            if batch:
+                task = asyncio.create_task(self._process(batch))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+    
+    async def _process(self, batch: List[_Request]):
+        try:
+            results = await self.service.abatch_analyze([intent for intent, _ in batch])
+        except Exception as e:
+            logger.error("GigaChat batch of %d failed: %s", len(batch), e)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
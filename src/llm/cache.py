@@ -0,0 +1,321 @@
+import json
+import time
+import zlib
+import logging
+import asyncio
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.metrics import get_collector
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import redis.asyncio as aioredis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+try:
+    from sentence_transformers import SentenceTransformer
+    SENTENCE_TRANSFORMERS_AVAILABLE = True
+except ImportError:
+    SENTENCE_TRANSFORMERS_AVAILABLE = False
+
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_SIZE = 1024
+COMPRESS_THRESHOLD = 1024
+SEMANTIC_CACHE_SIZE = 10000
+SEMANTIC_SAVE_EVERY = 16
+SEMANTIC_MIN_CAPACITY = 64
+SEMANTIC_CANDIDATES = 16
+
+
+def _json_default(value):
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def json_dumps(value: Any, sort_keys: bool = False) -> str:
+    if ORJSON_AVAILABLE:
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(value, default=_json_default, option=option).decode("utf-8")
+    return json.dumps(value, ensure_ascii=False, default=_json_default, sort_keys=sort_keys)
+
+
+json_loads = orjson.loads if ORJSON_AVAILABLE else json.loads
+
+
+class TwoTierLLMCache:
+    def __init__(self, maxsize: int = LLM_CACHE_SIZE, redis_url: Optional[str] = None, namespace: str = "llm"):
+        self.maxsize = maxsize
+        self.namespace = namespace
+        self._local: Dict[str, Tuple[float, str]] = {}
+        self._lock = threading.Lock()
+        self._redis = None
+        
+        if redis_url and REDIS_AVAILABLE:
+            self._redis = aioredis.Redis.from_url(redis_url)
+        elif redis_url:
+            logger.warning("redis is not installed, LLM cache is in-process only")
+    
+    def _get_payload(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._local.pop(key, None)
+            if entry is None or entry[0] < time.time():
+                return None
+            self._local[key] = entry
+        return entry[1]
+    
+    def get_local(self, key: str, op: str = "llm") -> Optional[Any]:
+        payload = self._get_payload(key)
+        get_collector().record_cache(op, payload is not None)
+        return json_loads(payload) if payload is not None else None
+    
+    def set_local(self, key: str, value: Any, ttl: int):
+        self._set_payload(key, json_dumps(value), ttl)
+    
+    def _set_payload(self, key: str, payload: str, ttl: int):
+        with self._lock:
+            self._local.pop(key, None)
+            if len(self._local) >= self.maxsize:
+                self._local.pop(next(iter(self._local)), None)
+            self._local[key] = (time.time() + ttl, payload)
+    
+    async def get(self, key: str, op: str = "llm") -> Optional[Any]:
+        if self._redis is None:
+            return self.get_local(key, op)
+        
+        payload = self._get_payload(key)
+        if payload is not None:
+            get_collector().record_cache(op, True)
+            return json_loads(payload)
+        
+        try:
+            raw = await self._redis.get(f"{self.namespace}:{key}")
+        except Exception as e:
+            logger.warning("Redis cache read failed: %s", e)
+            raw = None
+        
+        if raw is None:
+            get_collector().record_cache(op, False)
+            return None
+        
+        payload = (zlib.decompress(raw[1:]) if raw[:1] == b"z" else raw[1:]).decode("utf-8")
+        ttl = await self._ttl(key)
+        if ttl > 0:
+            self._set_payload(key, payload, ttl)
+        get_collector().record_cache(op, True)
+        return json_loads(payload)
+    
+    async def set(self, key: str, value: Any, ttl: int):
+        payload = json_dumps(value)
+        self._set_payload(key, payload, ttl)
+        if self._redis is None:
+            return
+        
+        data = payload.encode("utf-8")
+        data = b"z" + zlib.compress(data) if len(data) > COMPRESS_THRESHOLD else b"j" + data
+        try:
+            await self._redis.set(f"{self.namespace}:{key}", data, ex=ttl)
+        except Exception as e:
+            logger.warning("Redis cache write failed: %s", e)
+    
+    async def _ttl(self, key: str) -> int:
+        try:
+            return int(await self._redis.ttl(f"{self.namespace}:{key}"))
+        except Exception:
+            return 0
+
+
+class SemanticLLMCache:
+    def __init__(
+        self,
+        model_name: Optional[str],
+        threshold: float = 0.92,
+        path: Optional[Path] = None,
+        maxsize: int = SEMANTIC_CACHE_SIZE
+    ):
+        self.model_name = model_name
+        self.threshold = threshold
+        self.path = path
+        self.maxsize = maxsize
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._buffer: Optional[np.ndarray] = None
+        self._tag_ids: Optional[np.ndarray] = None
+        self._tag_codes: Dict[str, int] = {}
+        self._tag_names: List[str] = []
+        self._size = 0
+        self._vectors: Optional[np.ndarray] = None
+        self._payloads: List[str] = []
+        self._index = None
+        self._unsaved = 0
+        
+        if self.enabled and path is not None and path.exists():
+            self._load()
+    
+    @property
+    def enabled(self) -> bool:
+        return SENTENCE_TRANSFORMERS_AVAILABLE and bool(self.model_name)
+    
+    def _get_model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    logger.info("Loading semantic cache model: %s", self.model_name)
+                    self._model = SentenceTransformer(self.model_name)
+        return self._model
+    
+    def embed(self, text: str) -> np.ndarray:
+        vector = self._get_model().encode([text], normalize_embeddings=True)
+        return np.asarray(vector, dtype=np.float32)[0]
+    
+    def _rebuild_index(self):
+        self._index = None
+        if FAISS_AVAILABLE and self._vectors is not None:
+            self._index = faiss.IndexFlatIP(self._vectors.shape[1])
+            self._index.add(self._vectors)
+    
+    def _tag_code(self, tag: str) -> int:
+        code = self._tag_codes.get(tag)
+        if code is None:
+            code = self._tag_codes[tag] = len(self._tag_names)
+            self._tag_names.append(tag)
+        return code
+    
+    def _best_match(self, vector: np.ndarray, code: int) -> Tuple[int, float]:
+        tag_ids = self._tag_ids[:self._size]
+        if self._index is not None:
+            scores, ids = self._index.search(vector[None, :], min(SEMANTIC_CANDIDATES, self._size))
+            for score, i in zip(scores[0], ids[0]):
+                if i >= 0 and tag_ids[i] == code:
+                    return int(i), float(score)
+        
+        candidates = np.flatnonzero(tag_ids == code)
+        if not len(candidates):
+            return -1, 0.0
+        similarities = self._vectors[candidates] @ vector
+        best = int(np.argmax(similarities))
+        return int(candidates[best]), float(similarities[best])
+    
+    def lookup(self, vector: np.ndarray, tag: str = "", op: str = "semantic") -> Optional[Any]:
+        with self._lock:
+            payload = None
+            code = self._tag_codes.get(tag)
+            if self._vectors is not None and code is not None:
+                best, score = self._best_match(vector, code)
+                if best >= 0 and score >= self.threshold:
+                    payload = self._payloads[best]
+        
+        get_collector().record_cache(op, payload is not None)
+        return json_loads(payload) if payload is not None else None
+    
+    def _grow(self, dim: int):
+        capacity = min(self.maxsize + 1, max(SEMANTIC_MIN_CAPACITY, 2 * self._size))
+        buffer = np.empty((capacity, dim), dtype=np.float32)
+        tag_ids = np.empty(capacity, dtype=np.int64)
+        if self._buffer is not None:
+            buffer[:self._size] = self._buffer[:self._size]
+            tag_ids[:self._size] = self._tag_ids[:self._size]
+        self._buffer = buffer
+        self._tag_ids = tag_ids
+    
+    def add(self, vector: np.ndarray, value: Any, tag: str = ""):
+        snapshot = None
+        with self._lock:
+            if self._buffer is None or self._size == len(self._buffer):
+                self._grow(vector.shape[0])
+            self._buffer[self._size] = vector
+            self._tag_ids[self._size] = self._tag_code(tag)
+            self._size += 1
+            self._payloads.append(json_dumps(value))
+            
+            if self._size > self.maxsize:
+                keep = self.maxsize // 2
+                self._buffer[:keep] = self._buffer[self._size - keep:self._size]
+                self._tag_ids[:keep] = self._tag_ids[self._size - keep:self._size]
+                self._size = keep
+                self._vectors = self._buffer[:self._size]
+                self._payloads = self._payloads[-keep:]
+                self._rebuild_index()
+            else:
+                self._vectors = self._buffer[:self._size]
+                if self._index is not None:
+                    self._index.add(vector[None, :])
+                else:
+                    self._rebuild_index()
+            
+            self._unsaved += 1
+            if self.path is not None and self._unsaved >= SEMANTIC_SAVE_EVERY:
+                tags = [self._tag_names[code] for code in self._tag_ids[:self._size]]
+                snapshot = self._vectors.copy(), list(self._payloads), tags
+                self._unsaved = 0
+        
+        if snapshot is not None:
+            self._save(*snapshot)
+    
+    def get(self, text: str, tag: str = "", op: str = "semantic") -> Tuple[Optional[Any], Optional[np.ndarray]]:
+        if not self.enabled:
+            return None, None
+        try:
+            vector = self.embed(text)
+        except Exception as e:
+            logger.warning("Semantic cache embedding failed: %s", e)
+            return None, None
+        return self.lookup(vector, tag, op), vector
+    
+    async def aget(self, text: str, tag: str = "", op: str = "semantic") -> Tuple[Optional[Any], Optional[np.ndarray]]:
+        if not self.enabled:
+            return None, None
+        return await asyncio.to_thread(self.get, text, tag, op)
+    
+    def _save(self, vectors: np.ndarray, payloads: List[str], tags: List[str]):
+        tmp_path = self.path.with_suffix(".tmp.npz")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self._save_lock:
+                np.savez(
+                    tmp_path,
+                    vectors=vectors,
+                    payloads=np.array(payloads, dtype=str),
+                    tags=np.array(tags, dtype=str)
+                )
+                tmp_path.replace(self.path)
+        except Exception as e:
+            logger.warning("Failed to save semantic cache: %s", e)
+    
+    def _load(self):
+        try:
+            with np.load(self.path) as data:
+                tags = [str(t) for t in data["tags"]]
+                self._buffer = data["vectors"].astype(np.float32)
+                self._payloads = [str(p) for p in data["payloads"]]
+            self._size = len(self._buffer)
+            self._tag_ids = np.array([self._tag_code(tag) for tag in tags], dtype=np.int64)
+            self._vectors = self._buffer[:self._size]
+            self._rebuild_index()
+            logger.info("Loaded %d semantic cache entries", len(self._payloads))
+        except Exception as e:
+            logger.warning("Failed to load semantic cache: %s", e)
+            self._buffer, self._vectors, self._payloads, self._size = None, None, [], 0
+            self._tag_ids, self._tag_codes, self._tag_names = None, {}, []
@@ -1,77 +1,224 @@
+import re
+import copy
 import json
+import asyncio
+import hashlib
 import logging
-from typing import Optional, Dict, Any
+import threading
+from typing import Optional, Dict, Any, AsyncIterator, List, Tuple
 
 from langchain_core.messages import HumanMessage
 
+from config.settings import settings, SEMANTIC_CACHE_PATH
 from src.utils import get_llm
+from src.audio.emotion import AudioEmotionClassifier, PROFILE_MIDPOINTS
 from src.intent.extractor import UserIntent
+from .cache import TwoTierLLMCache, SemanticLLMCache, json_dumps, json_loads
 from .prompts import PromptBuilder
 
 logger = logging.getLogger(__name__)
 
+JSON_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.IGNORECASE)
+
+ANALYSIS_CACHE_TTL = 2 * 60 * 60
+RESPONSE_CACHE_TTL = 60 * 60
+CLARIFICATION_CACHE_TTL = 24 * 60 * 60
+
 
 class GigaChatService:
     def __init__(self):
         self._llm = None
         self.prompt_builder = PromptBuilder()
+        self._cache = TwoTierLLMCache(redis_url=settings.redis_url, namespace="gigachat")
+        self._semantic = SemanticLLMCache(
+            settings.semantic_cache_model,
+            threshold=settings.semantic_cache_threshold,
+            path=SEMANTIC_CACHE_PATH
+        )
     
     def _get_llm(self):
         if self._llm is None:
             self._llm = get_llm()
         return self._llm
     
+    def chat(self, prompt: str) -> str:
+        return self._get_llm().invoke([HumanMessage(content=prompt)]).content
+    
     def _parse_json_response(self, content: str) -> Optional[dict]:
-        content = content.strip()
-        if content.startswith("```json"):
-            content = content[7:]
-        if content.startswith("```"):
-            content = content[3:]
-        if content.endswith("```"):
-            content = content[:-3]
-        content = content.strip()
+        content = JSON_FENCE_RE.sub("", content).strip()
         
         try:
-            return json.loads(content)
+            return json_loads(content)
         except json.JSONDecodeError as e:
-            logger.warning(f"JSON parse error: {e}")
+            logger.warning("JSON parse error: %s", e)
             return None
     
+    @staticmethod
+    def _cache_key(op: str, intent: UserIntent, **extra) -> str:
+        raw = json_dumps({
+            "op": op,
+            "model": settings.default_model,
+            "e": intent.audio_emotion or "",
+            "c": round(intent.audio_emotion_confidence or 0, 1),
+            "g": sorted(intent.genres),
+            "l": intent.language or "",
+            "m": sorted(intent.mood_keywords),
+            "a": (intent.artist or "").lower(),
+            "t": (intent.transcript or "").lower().strip()[:200],
+            **extra,
+        }, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    
+    @classmethod
+    def _analysis_cache_key(cls, intent: UserIntent) -> str:
+        return cls._cache_key("analyze", intent)
+    
+    @staticmethod
+    def _semantic_text(intent: UserIntent) -> str:
+        return (intent.transcript or "").strip()
+    
+    @staticmethod
+    def _semantic_tag(intent: UserIntent) -> str:
+        return json_dumps([
+            intent.audio_emotion or "",
+            intent.language or "",
+            sorted(intent.genres),
+            (intent.artist or "").lower(),
+        ])
+    
+    @classmethod
+    def _response_cache_key(cls, tracks: list, intent: UserIntent, mood_interpretation: str) -> str:
+        track_ids = [t.get("spotify_id") or f"{t.get('artist')} - {t.get('name')}" for t in tracks]
+        return cls._cache_key("response", intent, mi=mood_interpretation, tracks=track_ids)
+    
+    @classmethod
+    def _clarification_cache_key(cls, intent: UserIntent) -> str:
+        return cls._cache_key("clarification", intent)
+    
+    def _parse_analysis(self, intent: UserIntent, content: str) -> Tuple[Dict[str, Any], bool]:
+        result = self._parse_json_response(content)
+        if result:
+            return result, True
+        return self._get_fallback_params(intent), False
+    
     def analyze_music_request(self, intent: UserIntent) -> Dict[str, Any]:
+        cache_key = self._analysis_cache_key(intent)
+        cached = self._cache.get_local(cache_key, "analyze")
+        if cached is not None:
+            logger.info("GigaChat analysis cache hit")
+            return cached
+        
+        tag = self._semantic_tag(intent)
+        similar, vector = self._semantic.get(self._semantic_text(intent), tag)
+        if similar is not None:
+            logger.info("GigaChat analysis semantic cache hit")
+            return similar
+        
         llm = self._get_llm()
         prompt = self.prompt_builder.build_music_analysis_prompt(intent)
         
         try:
             response = llm.invoke([HumanMessage(content=prompt)])
-            result = self._parse_json_response(response.content)
-            
-            if result:
-                return result
-            
+            result, ok = self._parse_analysis(intent, response.content)
+            if ok:
+                self._cache.set_local(cache_key, result, ANALYSIS_CACHE_TTL)
+                if vector is not None:
+                    self._semantic.add(vector, result, tag)
+            return result
         except Exception as e:
-            logger.error(f"GigaChat error: {e}")
+            logger.error("GigaChat error: %s", e)
         
         return self._get_fallback_params(intent)
     
-    def _get_fallback_params(self, intent: UserIntent) -> Dict[str, Any]:
-        from src.audio.emotion import EMOTION_MUSIC_PROFILES
+    async def aanalyze_music_request(self, intent: UserIntent) -> Dict[str, Any]:
+        cache_key = self._analysis_cache_key(intent)
+        cached = await self._cache.get(cache_key, "analyze")
+        if cached is not None:
+            logger.info("GigaChat analysis cache hit")
+            return cached
         
-        emotion = intent.audio_emotion or "neutral"
-        profile = EMOTION_MUSIC_PROFILES.get(emotion, EMOTION_MUSIC_PROFILES["neutral"])
+        tag = self._semantic_tag(intent)
+        similar, vector = await self._semantic.aget(self._semantic_text(intent), tag)
+        if similar is not None:
+            logger.info("GigaChat analysis semantic cache hit")
+            return similar
+        
+        llm = self._get_llm()
+        prompt = self.prompt_builder.build_music_analysis_prompt(intent)
         
-        valence = sum(profile["valence"]) / 2
-        energy = sum(profile["energy"]) / 2
-        danceability = sum(profile["danceability"]) / 2
-        tempo = sum(profile["tempo"]) / 2
+        try:
+            response = await llm.ainvoke([HumanMessage(content=prompt)])
+            result, ok = self._parse_analysis(intent, response.content)
+            if ok:
+                await self._cache.set(cache_key, result, ANALYSIS_CACHE_TTL)
+                if vector is not None:
+                    await asyncio.to_thread(self._semantic.add, vector, result, tag)
+            return result
+        except Exception as e:
+            logger.error("GigaChat error: %s", e)
+        
+        return self._get_fallback_params(intent)
+    
+    async def abatch_analyze(self, intents: List[UserIntent]) -> List[Dict[str, Any]]:
+        keys = [self._analysis_cache_key(intent) for intent in intents]
+        first: Dict[str, int] = {}
+        for i, key in enumerate(keys):
+            first.setdefault(key, i)
+        
+        resolved: Dict[str, Dict[str, Any]] = {}
+        vectors = {}
+        for key, i in first.items():
+            cached = await self._cache.get(key, "analyze")
+            if cached is None:
+                cached, vectors[key] = await self._semantic.aget(
+                    self._semantic_text(intents[i]), self._semantic_tag(intents[i])
+                )
+            if cached is not None:
+                resolved[key] = cached
+        
+        pending = [key for key in first if key not in resolved]
+        if pending:
+            llm = self._get_llm()
+            responses = await llm.abatch(
+                [
+                    [HumanMessage(content=self.prompt_builder.build_music_analysis_prompt(intents[first[key]]))]
+                    for key in pending
+                ],
+                config={"max_concurrency": settings.task_concurrency},
+                return_exceptions=True
+            )
+            
+            for key, response in zip(pending, responses):
+                intent = intents[first[key]]
+                if isinstance(response, Exception):
+                    logger.error("GigaChat error: %s", response)
+                    resolved[key] = self._get_fallback_params(intent)
+                    continue
+                
+                resolved[key], ok = self._parse_analysis(intent, response.content)
+                if ok:
+                    await self._cache.set(key, resolved[key], ANALYSIS_CACHE_TTL)
+                    if vectors.get(key) is not None:
+                        await asyncio.to_thread(self._semantic.add, vectors[key], resolved[key], self._semantic_tag(intent))
+        
+        return [
+            resolved[key] if first[key] == i else copy.deepcopy(resolved[key])
+            for i, key in enumerate(keys)
+        ]
+    
+    def _get_fallback_params(self, intent: UserIntent) -> Dict[str, Any]:
+        emotion = intent.audio_emotion or "neutral"
+        profile = AudioEmotionClassifier.get_music_profile(emotion)
+        mid = PROFILE_MIDPOINTS.get(emotion, PROFILE_MIDPOINTS["neutral"])
         
         return {
             "mood_interpretation": f"Настроение: {profile['description']}",
             "features": {
-                "valence": valence,
-                "energy": energy,
-                "danceability": danceability,
+                "valence": mid["valence"],
+                "energy": mid["energy"],
+                "danceability": mid["danceability"],
                 "acousticness": 0.3,
-                "tempo": tempo
+                "tempo": mid["tempo"]
             },
             "filters": {
                 "genres": intent.genres if intent.genres else None,
@@ -84,6 +231,11 @@ class GigaChatService:
         }
     
     def generate_response(self, tracks: list, intent: UserIntent, mood_interpretation: str) -> str:
+        cache_key = self._response_cache_key(tracks, intent, mood_interpretation)
+        cached = self._cache.get_local(cache_key, "response")
+        if cached is not None:
+            return cached
+        
         llm = self._get_llm()
         prompt = self.prompt_builder.build_recommendation_response_prompt(
             tracks, intent, mood_interpretation
@@ -91,11 +243,63 @@ class GigaChatService:
         
         try:
             response = llm.invoke([HumanMessage(content=prompt)])
-            return response.content.strip()
+            text = response.content.strip()
+            self._cache.set_local(cache_key, text, RESPONSE_CACHE_TTL)
+            return text
+        except Exception as e:
+            logger.error("Response generation error: %s", e)
+            return self._get_fallback_response(intent)
+    
+    async def agenerate_response(self, tracks: list, intent: UserIntent, mood_interpretation: str) -> str:
+        cache_key = self._response_cache_key(tracks, intent, mood_interpretation)
+        cached = await self._cache.get(cache_key, "response")
+        if cached is not None:
+            return cached
+        
+        llm = self._get_llm()
+        prompt = self.prompt_builder.build_recommendation_response_prompt(
+            tracks, intent, mood_interpretation
+        )
+        
+        try:
+            response = await llm.ainvoke([HumanMessage(content=prompt)])
+            text = response.content.strip()
+            await self._cache.set(cache_key, text, RESPONSE_CACHE_TTL)
+            return text
         except Exception as e:
-            logger.error(f"Response generation error: {e}")
+            logger.error("Response generation error: %s", e)
             return self._get_fallback_response(intent)
     
+    async def astream_response(self, tracks: list, intent: UserIntent, mood_interpretation: str) -> AsyncIterator[str]:
+        cache_key = self._response_cache_key(tracks, intent, mood_interpretation)
+        cached = await self._cache.get(cache_key, "response")
+        if cached is not None:
+            yield cached
+            return
+        
+        llm = self._get_llm()
+        prompt = self.prompt_builder.build_recommendation_response_prompt(
+            tracks, intent, mood_interpretation
+        )
+        
+        chunks = []
+        try:
+            async for chunk in llm.astream([HumanMessage(content=prompt)]):
+                if chunk.content:
+                    chunks.append(chunk.content)
+                    yield chunk.content
+        except Exception as e:
+            logger.error("Response streaming error: %s", e)
+            if not chunks:
+                yield await self.agenerate_response(tracks, intent, mood_interpretation)
+            return
+        
+        text = "".join(chunks).strip()
+        if text:
+            await self._cache.set(cache_key, text, RESPONSE_CACHE_TTL)
+        else:
+            yield self._get_fallback_response(intent)
+    
     def _get_fallback_response(self, intent: UserIntent) -> str:
         emotion = intent.audio_emotion
         
@@ -111,22 +315,50 @@ class GigaChatService:
         return responses.get(emotion, responses["neutral"])
     
     def generate_clarification(self, intent: UserIntent) -> str:
+        cache_key = self._clarification_cache_key(intent)
+        cached = self._cache.get_local(cache_key, "clarification")
+        if cached is not None:
+            return cached
+        
         llm = self._get_llm()
         prompt = self.prompt_builder.build_clarification_prompt(intent)
         
         try:
             response = llm.invoke([HumanMessage(content=prompt)])
-            return response.content.strip()
+            text = response.content.strip()
+            self._cache.set_local(cache_key, text, CLARIFICATION_CACHE_TTL)
+            return text
+        except Exception as e:
+            logger.error("Clarification generation error: %s", e)
+            return "Не совсем понял, какую музыку ты хочешь. Можешь сказать подробнее — какое у тебя настроение или какой жанр?"
+    
+    async def agenerate_clarification(self, intent: UserIntent) -> str:
+        cache_key = self._clarification_cache_key(intent)
+        cached = await self._cache.get(cache_key, "clarification")
+        if cached is not None:
+            return cached
+        
+        llm = self._get_llm()
+        prompt = self.prompt_builder.build_clarification_prompt(intent)
+        
+        try:
+            response = await llm.ainvoke([HumanMessage(content=prompt)])
+            text = response.content.strip()
+            await self._cache.set(cache_key, text, CLARIFICATION_CACHE_TTL)
+            return text
         except Exception as e:
-            logger.error(f"Clarification generation error: {e}")
+            logger.error("Clarification generation error: %s", e)
             return "Не совсем понял, какую музыку ты хочешь. Можешь сказать подробнее — какое у тебя настроение или какой жанр?"
 
 
 _service_instance: Optional[GigaChatService] = None
+_service_lock = threading.Lock()
 
 
 def get_gigachat_service() -> GigaChatService:
     global _service_instance
     if _service_instance is None:
-        _service_instance = GigaChatService()
+        with _service_lock:
+            if _service_instance is None:
+                _service_instance = GigaChatService()
     return _service_instance
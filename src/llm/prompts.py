@@ -3,48 +3,14 @@ from src.audio.emotion import EMOTION_MUSIC_PROFILES
 from src.intent.extractor import UserIntent
 
 
-class PromptBuilder:
-    AVAILABLE_GENRES = [
-        "pop", "dance", "electronic", "indie",
-        "hip_hop", "rap", "trap", "rnb",
-        "rock", "metal", "punk", "alternative",
-        "classical", "instrumental", "ambient", "jazz",
-        "folk", "latin", "soundtrack", "blues"
-    ]
-    
-    AVAILABLE_LANGUAGES = ["ru", "en", "instrumental", "other"]
-    
-    @staticmethod
-    def build_music_analysis_prompt(intent: UserIntent) -> str:
-        emotion_context = ""
-        if intent.audio_emotion:
-            profile = EMOTION_MUSIC_PROFILES.get(intent.audio_emotion, {})
-            emotion_desc = profile.get("description", "нейтральная")
-            confidence = intent.audio_emotion_confidence or 0
-            emotion_context = f"""
-По голосу пользователя определена эмоция: {intent.audio_emotion} ({emotion_desc})
-Уверенность: {confidence:.0%}
-"""
-        
-        text_context = f'Пользователь сказал: "{intent.transcript}"' if intent.transcript else ""
-        
-        preferences_context = ""
-        if intent.genres:
-            preferences_context += f"\nИз текста извлечены жанры: {', '.join(intent.genres)}"
-        if intent.language:
-            lang_map = {"ru": "русский", "en": "английский", "instrumental": "инструментальная музыка"}
-            preferences_context += f"\nПредпочтение языка: {lang_map.get(intent.language, intent.language)}"
-        if intent.mood_keywords:
-            preferences_context += f"\nКлючевые слова настроения: {', '.join(intent.mood_keywords)}"
-        
-        prompt = f"""Ты умный музыкальный ассистент. Твоя задача — понять настроение пользователя и подобрать идеальные параметры музыки.
+MUSIC_ANALYSIS_TEMPLATE = """Ты умный музыкальный ассистент. Твоя задача — понять настроение пользователя и подобрать идеальные параметры музыки.
 
 КОНТЕКСТ:
 {emotion_context}
 {text_context}
 {preferences_context}
 
-ДОСТУПНЫЕ ЖАНРЫ В БАЗЕ: {', '.join(PromptBuilder.AVAILABLE_GENRES)}
+ДОСТУПНЫЕ ЖАНРЫ В БАЗЕ: {available_genres}
 ДОСТУПНЫЕ ЯЗЫКИ: ru (русский), en (английский), instrumental (без слов), other (любой)
 
 ТВОЯ ЗАДАЧА:
@@ -98,27 +64,10 @@ class PromptBuilder:
     }},
     "explanation": "почему такой выбор параметров"
 }}"""
-        
-        return prompt
-    
-    @staticmethod
-    def build_recommendation_response_prompt(
-        tracks: List[Dict[str, Any]], 
-        intent: UserIntent,
-        mood_interpretation: str
-    ) -> str:
-        tracks_list = "\n".join([
-            f"- {t.get('artist', 'Unknown')} — {t.get('name', 'Unknown')}"
-            for t in tracks[:5]
-        ])
-        
-        emotion_text = ""
-        if intent.audio_emotion:
-            emotion_text = f"Эмоция в голосе: {intent.audio_emotion}"
-        
-        prompt = f"""Ты дружелюбный музыкальный бот. Пользователь попросил подобрать музыку.
 
-Что он сказал: "{intent.transcript}"
+RECOMMENDATION_RESPONSE_TEMPLATE = """Ты дружелюбный музыкальный бот. Пользователь попросил подобрать музыку.
+
+Что он сказал: "{transcript}"
 {emotion_text}
 Мы поняли его запрос так: {mood_interpretation}
 
@@ -132,15 +81,11 @@ class PromptBuilder:
 
 НЕ перечисляй треки — они будут показаны отдельно.
 Будь живым и эмпатичным, не формальным."""
-        
-        return prompt
-    
-    @staticmethod
-    def build_clarification_prompt(intent: UserIntent) -> str:
-        prompt = f"""Пользователь отправил голосовое сообщение, но его запрос неясен.
 
-Текст: "{intent.transcript}"
-Эмоция в голосе: {intent.audio_emotion or "не определена"}
+CLARIFICATION_TEMPLATE = """Пользователь отправил голосовое сообщение, но его запрос неясен.
+
+Текст: "{transcript}"
+Эмоция в голосе: {emotion}
 
 Мы не смогли понять:
 - Какую музыку он хочет
@@ -152,5 +97,75 @@ class PromptBuilder:
 - Может, что-то энергичное или спокойное?
 
 Используй эмодзи, будь дружелюбным."""
+
+LANGUAGE_NAMES = {"ru": "русский", "en": "английский", "instrumental": "инструментальная музыка"}
+
+
+class PromptBuilder:
+    AVAILABLE_GENRES = [
+        "pop", "dance", "electronic", "indie",
+        "hip_hop", "rap", "trap", "rnb",
+        "rock", "metal", "punk", "alternative",
+        "classical", "instrumental", "ambient", "jazz",
+        "folk", "latin", "soundtrack", "blues"
+    ]
+    
+    AVAILABLE_LANGUAGES = ["ru", "en", "instrumental", "other"]
+    
+    @staticmethod
+    def build_music_analysis_prompt(intent: UserIntent) -> str:
+        emotion_context = ""
+        if intent.audio_emotion:
+            profile = EMOTION_MUSIC_PROFILES.get(intent.audio_emotion, {})
+            emotion_desc = profile.get("description", "нейтральная")
+            confidence = intent.audio_emotion_confidence or 0
+            emotion_context = f"""
+По голосу пользователя определена эмоция: {intent.audio_emotion} ({emotion_desc})
+Уверенность: {confidence:.0%}
+"""
         
-        return prompt
+        text_context = f'Пользователь сказал: "{intent.transcript}"' if intent.transcript else ""
+        
+        preferences = []
+        if intent.genres:
+            preferences.append(f"\nИз текста извлечены жанры: {', '.join(intent.genres)}")
+        if intent.language:
+            preferences.append(f"\nПредпочтение языка: {LANGUAGE_NAMES.get(intent.language, intent.language)}")
+        if intent.mood_keywords:
+            preferences.append(f"\nКлючевые слова настроения: {', '.join(intent.mood_keywords)}")
+        
+        return MUSIC_ANALYSIS_TEMPLATE.format_map({
+            "emotion_context": emotion_context,
+            "text_context": text_context,
+            "preferences_context": "".join(preferences),
+            "available_genres": ", ".join(PromptBuilder.AVAILABLE_GENRES),
+        })
+    
+    @staticmethod
+    def build_recommendation_response_prompt(
+        tracks: List[Dict[str, Any]], 
+        intent: UserIntent,
+        mood_interpretation: str
+    ) -> str:
+        tracks_list = "\n".join([
+            f"- {t.get('artist', 'Unknown')} — {t.get('name', 'Unknown')}"
+            for t in tracks[:5]
+        ])
+        
+        emotion_text = ""
+        if intent.audio_emotion:
+            emotion_text = f"Эмоция в голосе: {intent.audio_emotion}"
+        
+        return RECOMMENDATION_RESPONSE_TEMPLATE.format_map({
+            "transcript": intent.transcript,
+            "emotion_text": emotion_text,
+            "mood_interpretation": mood_interpretation,
+            "tracks_list": tracks_list,
+        })
+    
+    @staticmethod
+    def build_clarification_prompt(intent: UserIntent) -> str:
+        return CLARIFICATION_TEMPLATE.format_map({
+            "transcript": intent.transcript,
+            "emotion": intent.audio_emotion or "не определена",
+        })
@@ -1,14 +1,41 @@
 import csv
 import time
+import queue
+import atexit
+import logging
+from contextvars import ContextVar
 from datetime import datetime
 from pathlib import Path
 from dataclasses import dataclass, field
-from typing import Optional
+from typing import Any, Dict, Optional
 import threading
+from collections import Counter
 
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
 
 METRICS_FILE = Path(__file__).parent.parent / "data" / "metrics.csv"
-_lock = threading.Lock()
+METRICS_COLUMNS = [
+    "request_id", "user_id", "timestamp",
+    "audio_duration_sec", "processing_time_sec",
+    "audio_valid", "validation_error",
+    "transcript", "transcript_length", "stt_time_sec",
+    "emotion", "emotion_confidence", "emotion_time_sec",
+    "intents_genre", "intents_language", "intents_count",
+    "llm_success", "llm_time_sec",
+    "response_first_token_sec", "response_time_sec",
+    "target_valence", "target_energy", "target_danceability", "target_tempo",
+    "tracks_found", "tracks_from_dataset", "tracks_from_spotify",
+    "success", "error"
+]
+METRICS_BATCH_SIZE = 32
+METRICS_FLUSH_INTERVAL = 1.0
+METRICS_QUEUE_SIZE = 10_000
+
+_queue: "queue.Queue[Optional[list]]" = queue.Queue(maxsize=METRICS_QUEUE_SIZE)
+_writer_thread: Optional[threading.Thread] = None
+_writer_lock = threading.Lock()
 
 
 @dataclass
@@ -37,6 +64,8 @@ class RequestMetrics:
     
     llm_success: bool = False
     llm_time_sec: float = 0.0
+    response_first_token_sec: float = 0.0
+    response_time_sec: float = 0.0
     target_valence: float = 0.0
     target_energy: float = 0.0
     target_danceability: float = 0.0
@@ -48,75 +77,172 @@ class RequestMetrics:
     
     success: bool = False
     error: str = ""
+    
+    def update_many(self, values: Dict[str, Any]):
+        self.__dict__.update(values)
+
+
+@dataclass
+class _RequestState:
+    metrics: RequestMetrics
+    start_time: float
+    step_times: dict = field(default_factory=dict)
 
 
 class MetricsCollector:
-    def __init__(self):
-        self._current: Optional[RequestMetrics] = None
-        self._start_time: float = 0
-        self._step_times: dict = {}
+    def __init__(self, enabled: Optional[bool] = None):
+        self.enabled = settings.metrics_enabled if enabled is None else enabled
+        self._state: ContextVar[Optional[_RequestState]] = ContextVar("request_metrics", default=None)
+        self._cache_counts: Counter = Counter()
+        self._cache_lock = threading.Lock()
+    
+    @property
+    def _current(self) -> Optional[RequestMetrics]:
+        state = self._state.get()
+        return state.metrics if state else None
     
     def start_request(self, user_id: int) -> RequestMetrics:
-        self._current = RequestMetrics(
+        metrics = RequestMetrics(
             request_id=f"{user_id}_{int(time.time()*1000)}",
             user_id=user_id,
             timestamp=datetime.now().isoformat()
         )
-        self._start_time = time.time()
-        self._step_times = {}
-        return self._current
+        self._state.set(_RequestState(metrics=metrics, start_time=time.time()))
+        return metrics
     
     def start_step(self, step_name: str):
-        self._step_times[step_name] = time.time()
+        state = self._state.get()
+        if state:
+            state.step_times[step_name] = time.time()
     
     def end_step(self, step_name: str) -> float:
-        if step_name in self._step_times:
-            elapsed = time.time() - self._step_times[step_name]
+        state = self._state.get()
+        if state and step_name in state.step_times:
+            elapsed = time.time() - state.step_times[step_name]
             return elapsed
         return 0.0
     
+    def record_cache(self, op: str, hit: bool):
+        with self._cache_lock:
+            self._cache_counts[(op, "hit" if hit else "miss")] += 1
+    
+    def cache_stats(self) -> dict:
+        with self._cache_lock:
+            counts = dict(self._cache_counts)
+        return {
+            op: {"hits": counts.get((op, "hit"), 0), "misses": counts.get((op, "miss"), 0)}
+            for op in sorted({op for op, _ in counts})
+        }
+    
     def finalize(self) -> RequestMetrics:
-        if self._current:
-            self._current.processing_time_sec = round(time.time() - self._start_time, 3)
+        state = self._state.get()
+        if state:
+            state.metrics.processing_time_sec = round(time.time() - state.start_time, 3)
         return self._current
     
     def save(self):
-        if not self._current:
+        m = self._current
+        if not m or not self.enabled:
             return
         
-        with _lock:
-            file_exists = METRICS_FILE.exists()
+        _ensure_writer()
+        _enqueue([
+            m.request_id, m.user_id, m.timestamp,
+            m.audio_duration_sec, m.processing_time_sec,
+            m.audio_valid, m.validation_error,
+            m.transcript[:200], m.transcript_length, m.stt_time_sec,
+            m.emotion, m.emotion_confidence, m.emotion_time_sec,
+            m.intents_genre, m.intents_language, m.intents_count,
+            m.llm_success, m.llm_time_sec,
+            m.response_first_token_sec, m.response_time_sec,
+            m.target_valence, m.target_energy, m.target_danceability, m.target_tempo,
+            m.tracks_found, m.tracks_from_dataset, m.tracks_from_spotify,
+            m.success, m.error
+        ])
+
+
+def _enqueue(row: list):
+    while True:
+        try:
+            _queue.put_nowait(row)
+            return
+        except queue.Full:
+            try:
+                _queue.get_nowait()
+                logger.warning("Metrics queue is full, dropping the oldest row")
+            except queue.Empty:
+                pass
+
+
+def _rotate_stale_file():
+    if not METRICS_FILE.exists():
+        return
+    
+    with open(METRICS_FILE, newline="", encoding="utf-8") as f:
+        header = next(csv.reader(f), None)
+    
+    if header and header != METRICS_COLUMNS:
+        stale = METRICS_FILE.with_name(f"{METRICS_FILE.stem}.{int(time.time())}{METRICS_FILE.suffix}")
+        METRICS_FILE.rename(stale)
+        logger.info("Metrics columns changed, moved old file to %s", stale.name)
+
+
+def _writer_loop():
+    METRICS_FILE.parent.mkdir(parents=True, exist_ok=True)
+    _rotate_stale_file()
+    
+    with open(METRICS_FILE, "a", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        if f.tell() == 0:
+            writer.writerow(METRICS_COLUMNS)
+            f.flush()
+        
+        stopping = False
+        while not stopping:
+            row = _queue.get()
+            if row is None:
+                break
+            
+            rows = [row]
+            deadline = time.monotonic() + METRICS_FLUSH_INTERVAL
             
-            with open(METRICS_FILE, "a", newline="", encoding="utf-8") as f:
-                writer = csv.writer(f)
-                
-                if not file_exists:
-                    writer.writerow([
-                        "request_id", "user_id", "timestamp",
-                        "audio_duration_sec", "processing_time_sec",
-                        "audio_valid", "validation_error",
-                        "transcript", "transcript_length", "stt_time_sec",
-                        "emotion", "emotion_confidence", "emotion_time_sec",
-                        "intents_genre", "intents_language", "intents_count",
-                        "llm_success", "llm_time_sec",
-                        "target_valence", "target_energy", "target_danceability", "target_tempo",
-                        "tracks_found", "tracks_from_dataset", "tracks_from_spotify",
-                        "success", "error"
-                    ])
-                
-                m = self._current
-                writer.writerow([
-                    m.request_id, m.user_id, m.timestamp,
-                    m.audio_duration_sec, m.processing_time_sec,
-                    m.audio_valid, m.validation_error,
-                    m.transcript[:200], m.transcript_length, m.stt_time_sec,
-                    m.emotion, m.emotion_confidence, m.emotion_time_sec,
-                    m.intents_genre, m.intents_language, m.intents_count,
-                    m.llm_success, m.llm_time_sec,
-                    m.target_valence, m.target_energy, m.target_danceability, m.target_tempo,
-                    m.tracks_found, m.tracks_from_dataset, m.tracks_from_spotify,
-                    m.success, m.error
-                ])
+            while len(rows) < METRICS_BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    row = _queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                rows.append(row)
+            
+            try:
+                writer.writerows(rows)
+                f.flush()
+            except Exception as e:
+                logger.error("Error saving metrics: %s", e)
+
+
+def _ensure_writer():
+    global _writer_thread
+    
+    if _writer_thread is not None:
+        return
+    
+    with _writer_lock:
+        if _writer_thread is None:
+            _writer_thread = threading.Thread(target=_writer_loop, name="metrics-writer", daemon=True)
+            _writer_thread.start()
+            atexit.register(_stop_writer)
+
+
+def _stop_writer():
+    if _writer_thread is not None and _writer_thread.is_alive():
+        _queue.put(None)
+        _writer_thread.join(timeout=5)
 
 
 _collector: Optional[MetricsCollector] = None
@@ -1,17 +1,68 @@
+import os
+import mmap
+import queue
+import asyncio
+import functools
+import hashlib
 import logging
-from dataclasses import dataclass, field
-from typing import List, Optional, Dict, Any
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import List, Optional, Dict, Any, AsyncIterator, Iterator, Union, BinaryIO
 
+from config.settings import settings
 from src.audio.processor import AudioProcessor, get_audio_processor, AudioProcessingResult
 from src.intent.extractor import extract_user_intent, UserIntent
+from src.llm.batcher import LLMBatcher
+from src.llm.cache import TwoTierLLMCache
 from src.llm.gigachat import GigaChatService, get_gigachat_service
 from src.recommender.music import MusicRecommender, get_music_recommender, Track
 from src.spotify_client import SpotifyClient, get_spotify_client
-from src.track_validator import TrackValidator, get_track_validator, ValidatedTrack
+from src.track_validator import TrackValidator, get_track_validator
 from src.metrics import get_collector
 
 logger = logging.getLogger(__name__)
 
+AUDIO_CACHE_TTL = 24 * 60 * 60
+RESPONSE_STREAM_INTERVAL = 1.0
+RECOMMEND_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+
+INVALID_AUDIO_MESSAGES = {
+    "silence": "В сообщении тишина. Попробуй записать еще раз.",
+    "too_short": "Сообщение слишком короткое. Расскажи подробнее, какую музыку хочешь.",
+    "too_noisy": "Слишком много шума, не могу разобрать. Попробуй в более тихом месте.",
+    "transcript_too_short": "Не удалось распознать речь. Попробуй еще раз.",
+    "no_speech": "Не слышу речи в сообщении. Попробуй записать еще раз.",
+    "no_audio_provided": "Отправь голосовое сообщение, и я подберу музыку."
+}
+
+SPOTIFY_MOOD_MAP = {
+    "happy": "happy",
+    "sad": "sad",
+    "angry": "energetic",
+    "neutral": "calm",
+    "fear": "calm",
+    "disgust": "sad",
+    "surprise": "energetic"
+}
+
+_recommend_pool = ThreadPoolExecutor(max_workers=RECOMMEND_WORKERS, thread_name_prefix="recommender")
+_sync_loop: Optional[asyncio.AbstractEventLoop] = None
+_sync_loop_lock = threading.Lock()
+
+
+def _get_sync_loop() -> asyncio.AbstractEventLoop:
+    """Общий фоновый event loop для синхронных оберток."""
+    global _sync_loop
+    if _sync_loop is None:
+        with _sync_loop_lock:
+            if _sync_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="pipeline-loop", daemon=True).start()
+                _sync_loop = loop
+    return _sync_loop
+
 
 @dataclass
 class PipelineResult:
@@ -19,6 +70,7 @@ class PipelineResult:
     error_message: Optional[str] = None
     response_text: str = ""
     tracks: List[Track] = field(default_factory=list)
+    track_dicts: List[dict] = field(default_factory=list)
     transcript: Optional[str] = None
     audio_emotion: Optional[str] = None
     intent: Optional[UserIntent] = None
@@ -31,13 +83,19 @@ class PipelineResult:
             "success": self.success,
             "error_message": self.error_message,
             "response_text": self.response_text,
-            "tracks": [t.to_dict() for t in self.tracks],
+            "tracks": self.track_dicts or [t.to_dict() for t in self.tracks],
             "transcript": self.transcript,
             "audio_emotion": self.audio_emotion,
             "mood_interpretation": self.mood_interpretation,
         }
 
 
+@dataclass
+class PartialResult:
+    stage: str
+    result: PipelineResult
+
+
 class MusicRecommendationPipeline:
     def __init__(
         self,
@@ -54,59 +112,148 @@ class MusicRecommendationPipeline:
         self.music_recommender = music_recommender or get_music_recommender()
         self.spotify_client = spotify_client or get_spotify_client()
         self.track_validator = track_validator or get_track_validator()
+        self.analyze_batcher = LLMBatcher(self.gigachat_service)
         self.use_spotify_search = use_spotify_search
         self.validate_tracks_flag = validate_tracks
+        self._audio_cache = TwoTierLLMCache(redis_url=settings.redis_url, namespace="audio")
     
     def process_audio(
         self,
         audio_path: str = None,
-        audio_bytes: bytes = None,
+        audio_bytes: Union[bytes, BinaryIO] = None,
+        audio_format: str = "ogg",
+        top_k: int = 5,
+        user_id: int = 0
+    ) -> PipelineResult:
+        return asyncio.run_coroutine_threadsafe(self.aprocess_audio(
+            audio_path=audio_path,
+            audio_bytes=audio_bytes,
+            audio_format=audio_format,
+            top_k=top_k,
+            user_id=user_id
+        ), _get_sync_loop()).result()
+    
+    async def aprocess_audio(
+        self,
+        audio_path: str = None,
+        audio_bytes: Union[bytes, BinaryIO] = None,
         audio_format: str = "ogg",
         top_k: int = 5,
         user_id: int = 0
     ) -> PipelineResult:
+        async for partial in self.aprocess_audio_stream(
+            audio_path=audio_path,
+            audio_bytes=audio_bytes,
+            audio_format=audio_format,
+            top_k=top_k,
+            user_id=user_id
+        ):
+            result = partial.result
+        return result
+    
+    def process_audio_stream(
+        self,
+        audio_path: str = None,
+        audio_bytes: Union[bytes, BinaryIO] = None,
+        audio_format: str = "ogg",
+        top_k: int = 5,
+        user_id: int = 0
+    ) -> Iterator[PartialResult]:
+        """Синхронная обертка над aprocess_audio_stream для вызова вне event loop."""
+        partials: "queue.Queue[Optional[PartialResult]]" = queue.Queue()
+        
+        async def drain():
+            try:
+                async for partial in self.aprocess_audio_stream(
+                    audio_path=audio_path,
+                    audio_bytes=audio_bytes,
+                    audio_format=audio_format,
+                    top_k=top_k,
+                    user_id=user_id
+                ):
+                    partials.put(partial)
+            finally:
+                partials.put(None)
+        
+        future = asyncio.run_coroutine_threadsafe(drain(), _get_sync_loop())
+        try:
+            while (partial := partials.get()) is not None:
+                yield partial
+            future.result()
+        finally:
+            future.cancel()
+    
+    async def aprocess_audio_stream(
+        self,
+        audio_path: str = None,
+        audio_bytes: Union[bytes, BinaryIO] = None,
+        audio_format: str = "ogg",
+        top_k: int = 5,
+        user_id: int = 0
+    ) -> AsyncIterator[PartialResult]:
+        """Выдает промежуточные результаты по этапам: transcript, tracks, response, done."""
         metrics = get_collector()
         m = metrics.start_request(user_id)
         
         logger.info("Step 1: Audio processing...")
         metrics.start_step("audio")
         
-        audio_result = self.audio_processor.process(
-            audio_path=audio_path,
-            audio_bytes=audio_bytes,
-            audio_format=audio_format
-        )
+        audio_key = self._audio_cache_key(audio_path, audio_bytes, audio_format)
+        cached = await self._audio_cache.get(audio_key, "audio") if audio_key else None
         
-        m.audio_duration_sec = audio_result.duration or 0.0
-        m.stt_time_sec = metrics.end_step("audio")
+        if cached is not None:
+            logger.info("Audio result cache hit")
+            audio_result = AudioProcessingResult(**cached)
+        else:
+            audio_result = await asyncio.to_thread(
+                self.audio_processor.process,
+                audio_path=audio_path,
+                audio_bytes=audio_bytes,
+                audio_format=audio_format
+            )
+            if audio_key and audio_result.status != "error":
+                await self._audio_cache.set(audio_key, asdict(audio_result), AUDIO_CACHE_TTL)
+        
+        m.update_many({
+            "audio_duration_sec": audio_result.duration or 0.0,
+            "stt_time_sec": metrics.end_step("audio"),
+        })
         
         if audio_result.status != "ok":
-            m.audio_valid = False
-            m.validation_error = audio_result.reason or ""
-            m.success = False
-            m.error = audio_result.reason or "invalid_audio"
+            m.update_many({
+                "audio_valid": False,
+                "validation_error": audio_result.reason or "",
+                "success": False,
+                "error": audio_result.reason or "invalid_audio",
+            })
             metrics.finalize()
             metrics.save()
             
-            error_messages = {
-                "invalid_audio": self._get_invalid_audio_message(audio_result.reason),
-                "error": f"Error: {audio_result.reason}"
-            }
-            return PipelineResult(
+            if audio_result.status == "invalid_audio":
+                error_message = self._get_invalid_audio_message(audio_result.reason)
+            elif audio_result.status == "error":
+                error_message = f"Error: {audio_result.reason}"
+            else:
+                error_message = "Unknown error"
+            yield PartialResult("done", PipelineResult(
                 success=False,
-                error_message=error_messages.get(audio_result.status, "Unknown error"),
+                error_message=error_message,
                 transcript=audio_result.transcript,
                 audio_emotion=audio_result.emotion
-            )
+            ))
+            return
         
-        m.audio_valid = True
-        m.transcript = audio_result.transcript or ""
-        m.transcript_length = len(m.transcript)
-        m.emotion = audio_result.emotion or ""
-        m.emotion_confidence = audio_result.emotion_confidence or 0.0
+        transcript = audio_result.transcript or ""
+        m.update_many({
+            "audio_valid": True,
+            "transcript": transcript,
+            "transcript_length": len(transcript),
+            "emotion": audio_result.emotion or "",
+            "emotion_confidence": audio_result.emotion_confidence or 0.0,
+        })
         
-        logger.info(f"Transcript: {audio_result.transcript}")
-        logger.info(f"Emotion: {audio_result.emotion} ({audio_result.emotion_confidence})")
+        logger.info("Transcript: %s", audio_result.transcript)
+        logger.info("Emotion: %s (%s)", audio_result.emotion, audio_result.emotion_confidence)
         
         logger.info("Step 2: Intent extraction...")
         
@@ -116,16 +263,19 @@ class MusicRecommendationPipeline:
             audio_emotion_confidence=audio_result.emotion_confidence
         )
         
-        m.intents_genre = ",".join(intent.genres) if intent.genres else ""
-        m.intents_language = intent.language or ""
-        m.intents_count = len(intent.genres) + (1 if intent.language else 0) + (1 if intent.artist else 0)
+        if metrics.enabled:
+            m.update_many({
+                "intents_genre": ",".join(intent.genres),
+                "intents_language": intent.language or "",
+                "intents_count": len(intent.genres) + bool(intent.language) + bool(intent.artist),
+            })
         
-        logger.info(f"Genres: {intent.genres}")
-        logger.info(f"Language: {intent.language}")
-        logger.info(f"Artist: {intent.artist}")
+        logger.info("Genres: %s", intent.genres)
+        logger.info("Language: %s", intent.language)
+        logger.info("Artist: %s", intent.artist)
         
         needs_clarification = (
-            len(audio_result.transcript or "") < 5 and
+            len(transcript) < 5 and
             not intent.genres and
             not intent.mood_keywords and
             (audio_result.emotion_confidence or 0) < 0.5
@@ -133,23 +283,38 @@ class MusicRecommendationPipeline:
         
         if needs_clarification:
             logger.info("Request is unclear, asking for clarification")
-            clarification = self.gigachat_service.generate_clarification(intent)
+            llm_task = asyncio.create_task(self.gigachat_service.agenerate_clarification(intent))
+        else:
+            logger.info("Step 3: GigaChat analysis...")
+            metrics.start_step("llm")
+            llm_task = asyncio.create_task(self.analyze_batcher.submit(intent))
+        
+        try:
+            yield PartialResult("transcript", PipelineResult(
+                success=True,
+                transcript=audio_result.transcript,
+                audio_emotion=audio_result.emotion
+            ))
+        except GeneratorExit:
+            llm_task.cancel()
+            raise
+        
+        if needs_clarification:
+            clarification = await llm_task
             m.success = True
             metrics.finalize()
             metrics.save()
-            return PipelineResult(
+            yield PartialResult("done", PipelineResult(
                 success=True,
                 response_text=clarification,
                 tracks=[],
                 transcript=audio_result.transcript,
                 audio_emotion=audio_result.emotion,
                 intent=intent,
-            )
-        
-        logger.info("Step 3: GigaChat analysis...")
-        metrics.start_step("llm")
+            ))
+            return
         
-        analysis = self.gigachat_service.analyze_music_request(intent)
+        analysis = await llm_task
         
         m.llm_time_sec = metrics.end_step("llm")
         m.llm_success = bool(analysis)
@@ -158,15 +323,17 @@ class MusicRecommendationPipeline:
         filters = analysis.get("filters", {})
         mood_interpretation = analysis.get("mood_interpretation", "")
         
-        m.target_valence = features.get("valence", 0.0)
-        m.target_energy = features.get("energy", 0.0)
-        m.target_danceability = features.get("danceability", 0.0)
-        m.target_tempo = features.get("tempo", 0.0)
+        m.update_many({
+            "target_valence": features.get("valence", 0.0),
+            "target_energy": features.get("energy", 0.0),
+            "target_danceability": features.get("danceability", 0.0),
+            "target_tempo": features.get("tempo", 0.0),
+        })
         
-        logger.info(f"Interpretation: {mood_interpretation}")
+        logger.info("Interpretation: %s", mood_interpretation)
         
         if filters.get("artist"):
-            logger.info(f"Artist: {filters.get('artist')}")
+            logger.info("Artist: %s", filters.get("artist"))
         
         if intent.language and not filters.get("language"):
             filters["language"] = intent.language
@@ -175,81 +342,124 @@ class MusicRecommendationPipeline:
         
         logger.info("Step 4: Track recommendation...")
         
-        tracks = self.music_recommender.recommend(
-            features=features,
-            filters=filters,
-            top_k=top_k
+        tracks = await asyncio.get_running_loop().run_in_executor(
+            _recommend_pool,
+            functools.partial(self.music_recommender.recommend, features=features, filters=filters, top_k=top_k)
         )
         
         m.tracks_from_dataset = len(tracks)
-        logger.info(f"Found {len(tracks)} tracks from local dataset")
+        logger.info("Found %d tracks from local dataset", len(tracks))
         
-        if self.use_spotify_search and self.spotify_client.is_available() and len(tracks) < top_k:
-            spotify_tracks = self._search_spotify_tracks(intent, features, top_k - len(tracks))
-            if spotify_tracks:
-                tracks.extend(spotify_tracks)
-                m.tracks_from_spotify = len(spotify_tracks)
-                logger.info(f"Added {len(spotify_tracks)} tracks from Spotify search")
+        search_spotify = self.use_spotify_search and self.spotify_client.is_available() and len(tracks) < top_k
+        validate = self.validate_tracks_flag
         
-        if self.validate_tracks_flag and tracks:
+        if validate and tracks:
             logger.info("Step 4b: Validating tracks...")
-            track_dicts = [t.to_dict() for t in tracks]
-            validated = self.track_validator.validate_and_enrich(
-                track_dicts,
-                max_spotify_calls=3,
-                use_gigachat=False
-            )
-            
-            tracks = []
-            for v in validated:
-                track = Track(
-                    spotify_id=v.spotify_id,
-                    name=v.name,
-                    artist=v.artist,
-                    year=v.year,
-                    genres=v.genres,
-                    language=v.language,
-                )
-                tracks.append(track)
-            
-            verified_count = sum(1 for v in validated if v.is_verified)
-            logger.info(f"Validated {len(tracks)} tracks, {verified_count} verified via Spotify")
+        
+        spotify_task = asyncio.create_task(asyncio.to_thread(
+            self._search_spotify_tracks, intent, features, top_k - len(tracks)
+        )) if search_spotify else None
+        
+        if validate and tracks:
+            await self.track_validator.aenrich_tracks(tracks)
+        spotify_tracks = await spotify_task if spotify_task else []
+        
+        if spotify_tracks:
+            m.tracks_from_spotify = len(spotify_tracks)
+            logger.info("Added %d tracks from Spotify search", len(spotify_tracks))
+            if validate:
+                await self.track_validator.aenrich_tracks(spotify_tracks)
+            tracks = tracks + spotify_tracks
+        
+        if validate and tracks:
+            verified_count = sum(1 for t in tracks if t.verified)
+            logger.info("Validated %d tracks, %d verified via Spotify", len(tracks), verified_count)
         
         m.tracks_found = len(tracks)
+        track_dicts = [t.to_dict() for t in tracks]
+        
+        yield PartialResult("tracks", PipelineResult(
+            success=True,
+            tracks=tracks,
+            track_dicts=track_dicts,
+            transcript=audio_result.transcript,
+            audio_emotion=audio_result.emotion,
+            intent=intent,
+            mood_interpretation=mood_interpretation,
+            features=features,
+            filters=filters
+        ))
         
         logger.info("Step 5: Response generation...")
         
-        response_text = self.gigachat_service.generate_response(
-            tracks=[t.to_dict() for t in tracks],
+        metrics.start_step("response")
+        chunks = []
+        last_emit = 0.0
+        
+        async for chunk in self.gigachat_service.astream_response(
+            tracks=track_dicts,
             intent=intent,
             mood_interpretation=mood_interpretation
-        )
-        
+        ):
+            if not chunks:
+                m.response_first_token_sec = metrics.end_step("response")
+            chunks.append(chunk)
+            
+            now = time.monotonic()
+            if now - last_emit >= RESPONSE_STREAM_INTERVAL:
+                last_emit = now
+                yield PartialResult("response", PipelineResult(
+                    success=True,
+                    response_text="".join(chunks).strip(),
+                    tracks=tracks,
+                    track_dicts=track_dicts,
+                    transcript=audio_result.transcript,
+                    audio_emotion=audio_result.emotion,
+                    intent=intent
+                ))
+        
+        response_text = "".join(chunks).strip()
+        m.response_time_sec = metrics.end_step("response")
         m.success = True
         metrics.finalize()
         metrics.save()
         
-        return PipelineResult(
+        yield PartialResult("done", PipelineResult(
             success=True,
             response_text=response_text,
             tracks=tracks,
+            track_dicts=track_dicts,
             transcript=audio_result.transcript,
             audio_emotion=audio_result.emotion,
             intent=intent,
             mood_interpretation=mood_interpretation,
             features=features,
             filters=filters
-        )
+        ))
+    
+    @staticmethod
+    def _audio_cache_key(
+        audio_path: Optional[str],
+        audio_bytes: Union[bytes, BinaryIO, None],
+        audio_format: str
+    ) -> Optional[str]:
+        digest = hashlib.blake2b(digest_size=16)
+        try:
+            if audio_path:
+                with open(audio_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    digest.update(data)
+            elif isinstance(audio_bytes, (bytes, bytearray, memoryview)):
+                digest.update(audio_bytes)
+            elif hasattr(audio_bytes, "getbuffer"):
+                digest.update(audio_bytes.getbuffer())
+            else:
+                return None
+        except (OSError, ValueError):
+            return None
+        return f"{digest.hexdigest()}:{audio_format}:{settings.whisper_model_size}"
     
     def _get_invalid_audio_message(self, reason: str) -> str:
-        messages = {
-            "silence": "В сообщении тишина. Попробуй записать еще раз.",
-            "too_short": "Сообщение слишком короткое. Расскажи подробнее, какую музыку хочешь.",
-            "too_noisy": "Слишком много шума, не могу разобрать. Попробуй в более тихом месте.",
-            "transcript_too_short": "Не удалось распознать речь. Попробуй еще раз.",
-            "no_audio_provided": "Отправь голосовое сообщение, и я подберу музыку."
-        }
-        return messages.get(reason, "Что-то пошло не так. Попробуй еще раз.")
+        return INVALID_AUDIO_MESSAGES.get(reason, "Что-то пошло не так. Попробуй еще раз.")
     
     def _search_spotify_tracks(
         self,
@@ -257,17 +467,7 @@ class MusicRecommendationPipeline:
         features: Dict[str, float],
         limit: int
     ) -> List[Track]:
-        mood_map = {
-            "happy": "happy",
-            "sad": "sad",
-            "angry": "energetic",
-            "neutral": "calm",
-            "fear": "calm",
-            "disgust": "sad",
-            "surprise": "energetic"
-        }
-        
-        mood = mood_map.get(intent.audio_emotion, "")
+        mood = SPOTIFY_MOOD_MAP.get(intent.audio_emotion, "")
         genre = intent.genres[0] if intent.genres else None
         language = intent.language
         
@@ -289,28 +489,47 @@ class MusicRecommendationPipeline:
             market = "RU" if language == "ru" else "US"
             spotify_results = self.spotify_client.search_tracks(query, limit=limit, market=market)
         
-        tracks = []
-        for item in spotify_results:
-            track = Track(
+        language = language or "other"
+        valence = features.get("valence", 0.5)
+        energy = features.get("energy", 0.5)
+        danceability = features.get("danceability", 0.5)
+        
+        return [
+            Track(
                 spotify_id=item["spotify_id"],
                 name=item["name"],
                 artist=item["artist"],
-                year=int(item["release_date"][:4]) if item.get("release_date") and len(item["release_date"]) >= 4 else None,
-                language=language or "other",
-                valence=features.get("valence", 0.5),
-                energy=features.get("energy", 0.5),
-                danceability=features.get("danceability", 0.5),
+                year=int(release_date[:4]) if (release_date := item.get("release_date")) and len(release_date) >= 4 else None,
+                language=language,
+                valence=valence,
+                energy=energy,
+                danceability=danceability,
             )
-            tracks.append(track)
-        
-        return tracks
+            for item in spotify_results
+        ]
 
 
 _pipeline_instance: Optional[MusicRecommendationPipeline] = None
+_pipeline_lock = threading.Lock()
 
 
 def get_pipeline() -> MusicRecommendationPipeline:
     global _pipeline_instance
     if _pipeline_instance is None:
-        _pipeline_instance = MusicRecommendationPipeline()
+        with _pipeline_lock:
+            if _pipeline_instance is None:
+                _pipeline_instance = MusicRecommendationPipeline()
     return _pipeline_instance
+
+
+def warm_pipeline() -> MusicRecommendationPipeline:
+    factories = [
+        get_audio_processor,
+        get_gigachat_service,
+        get_music_recommender,
+        get_spotify_client,
+        get_track_validator,
+    ]
+    with ThreadPoolExecutor(max_workers=len(factories)) as executor:
+        list(executor.map(lambda factory: factory(), factories))
+    return get_pipeline()
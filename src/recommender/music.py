@@ -1,13 +1,29 @@
 import ast
+import contextlib
+import functools
 import logging
 import re
+import threading
 from pathlib import Path
 from dataclasses import dataclass, field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 
 import pandas as pd
 import numpy as np
 
+try:
+    from numba import njit, prange, threading_layer
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+try:
+    from rapidfuzz import process as rf_process
+    from rapidfuzz.distance import Levenshtein as RFLevenshtein
+    RAPIDFUZZ_AVAILABLE = True
+except ImportError:
+    RAPIDFUZZ_AVAILABLE = False
+
 logger = logging.getLogger(__name__)
 
 ARTIST_ALIASES = {
@@ -41,43 +57,85 @@ ARTIST_ALIASES = {
 }
 
 
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, nogil=True, cache=True)
+    def _weighted_distance(features, positions, target, weights):
+        out = np.empty(len(positions))
+        for n in prange(len(positions)):
+            i = positions[n]
+            d = 0.0
+            for j in range(features.shape[1]):
+                t = np.float64(features[i, j] - target[j])
+                d += t * t * weights[j]
+            out[n] = np.sqrt(d)
+        return out
+    
+    @njit(nogil=True, cache=True)
+    def _levenshtein_codes(s1, s2):
+        row = np.arange(len(s2) + 1, dtype=np.int32)
+        for i in range(len(s1)):
+            diagonal = row[0]
+            row[0] = i + 1
+            for j in range(len(s2)):
+                cost = diagonal + (s1[i] != s2[j])
+                diagonal = row[j + 1]
+                row[j + 1] = min(diagonal + 1, row[j] + 1, cost)
+        return row[len(s2)]
+    
+    def _codepoints(text: str) -> np.ndarray:
+        return np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+    
+    _kernel_lock = threading.Lock()
+    
+    def _kernel_guard():
+        """Сериализует вызовы ядра, если numba работает на непотокобезопасном workqueue."""
+        try:
+            layer = threading_layer()
+        except ValueError:
+            return _kernel_lock
+        return _kernel_lock if layer == "workqueue" else contextlib.nullcontext()
+
+
+_ARTIST_PUNCT_RE = re.compile(r'[\.\-\s\'\"\,]+')
+
+_TRANSLIT_TABLE = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e',
+    'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
+    'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+    'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch',
+    'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+})
+
+_ARTIST_REPLACEMENTS = (
+    ('oo', 'u'),
+    ('uu', 'u'),
+    ('ii', 'i'),
+    ('ee', 'e'),
+    ('aa', 'a'),
+    ('dj', 'j'),
+    ('dzh', 'j'),
+)
+
+
+@functools.lru_cache(maxsize=4096)
 def normalize_artist_name(name: str) -> str:
     """Нормализует имя артиста для нечёткого поиска."""
     if not name:
         return ""
-    name = name.lower().strip()
-    name = re.sub(r'[\.\-\s\'\"\,]+', '', name)
-    
-    translit = {
-        'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e',
-        'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
-        'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
-        'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch',
-        'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
-    }
-    result = []
-    for char in name:
-        result.append(translit.get(char, char))
-    name = ''.join(result)
-    
-    replacements = {
-        'oo': 'u', 
-        'uu': 'u',
-        'ii': 'i',
-        'ee': 'e',
-        'aa': 'a',
-        'dj': 'j',
-        'dzh': 'j',
-    }
-    for old, new in replacements.items():
+    name = _ARTIST_PUNCT_RE.sub('', name.lower().strip()).translate(_TRANSLIT_TABLE)
+    for old, new in _ARTIST_REPLACEMENTS:
         name = name.replace(old, new)
     return name
 
 
-def levenshtein_distance(s1: str, s2: str) -> int:
+def levenshtein_distance(s1: str, s2: str, score_cutoff: Optional[int] = None) -> int:
     """Вычисляет расстояние Левенштейна между двумя строками."""
+    if RAPIDFUZZ_AVAILABLE:
+        return RFLevenshtein.distance(s1, s2, score_cutoff=score_cutoff)
+    if NUMBA_AVAILABLE:
+        return int(_levenshtein_codes(_codepoints(s1), _codepoints(s2)))
     if len(s1) < len(s2):
-        return levenshtein_distance(s2, s1)
+        return levenshtein_distance(s2, s1, score_cutoff)
     if len(s2) == 0:
         return len(s1)
     
@@ -96,9 +154,11 @@ def levenshtein_distance(s1: str, s2: str) -> int:
 
 def fuzzy_artist_match(query: str, candidate: str, threshold: float = 0.7) -> bool:
     """Проверяет нечёткое совпадение имён артистов."""
-    q_norm = normalize_artist_name(query)
-    c_norm = normalize_artist_name(candidate)
-    
+    return _fuzzy_norm_match(normalize_artist_name(query), normalize_artist_name(candidate), threshold)
+
+
+def _fuzzy_norm_match(q_norm: str, c_norm: str, threshold: float = 0.7) -> bool:
+    """Сравнивает уже нормализованные имена артистов."""
     if not q_norm or not c_norm:
         return False
     
@@ -108,6 +168,9 @@ def fuzzy_artist_match(query: str, candidate: str, threshold: float = 0.7) -> bo
     if q_norm in c_norm or c_norm in q_norm:
         return True
     
+    if RAPIDFUZZ_AVAILABLE:
+        return RFLevenshtein.normalized_similarity(q_norm, c_norm) >= threshold
+    
     max_len = max(len(q_norm), len(c_norm))
     if max_len == 0:
         return False
@@ -121,27 +184,67 @@ def fuzzy_artist_match(query: str, candidate: str, threshold: float = 0.7) -> bo
     return False
 
 
+def _display_artist(raw: str) -> Optional[str]:
+    """Извлекает отображаемое имя артиста из ячейки датасета."""
+    name = raw
+    if raw.startswith("[") and raw.endswith("]"):
+        try:
+            parsed = ast.literal_eval(raw)
+            if not isinstance(parsed, list) or not parsed:
+                return None
+            name = str(parsed[0]) if len(parsed) == 1 else ", ".join(parsed)
+        except:
+            name = raw.strip("[]'\"")
+    
+    if not name or name.lower() in INVALID_ARTIST_NAMES:
+        return None
+    return name
+
+
 def resolve_artist_alias(query: str) -> str:
     """Проверяет алиасы и возвращает каноническое имя артиста."""
     query_lower = query.lower().strip()
     query_norm = normalize_artist_name(query_lower)
     
-    for canonical, aliases in ARTIST_ALIASES.items():
-        for alias in aliases:
-            alias_norm = normalize_artist_name(alias)
-            if query_norm == alias_norm or query_lower == alias.lower():
-                return canonical
-            if levenshtein_distance(query_norm, alias_norm) <= 2:
-                return canonical
+    canonical = _ALIAS_BY_NORM.get(query_norm)
+    if canonical is not None:
+        return canonical
+    
+    if RAPIDFUZZ_AVAILABLE:
+        distances = rf_process.cdist([query_norm], _ALIAS_NORMS, scorer=RFLevenshtein.distance, score_cutoff=2)[0]
+        hits = np.flatnonzero((distances <= 2) | (_ALIAS_LOWERS == query_lower))
+        return _ALIAS_CANONICALS[hits[0]] if len(hits) else query
+    
+    for canonical, alias_lower, alias_norm in zip(_ALIAS_CANONICALS, _ALIAS_LOWERS, _ALIAS_NORMS):
+        if query_norm == alias_norm or query_lower == alias_lower:
+            return canonical
+        if levenshtein_distance(query_norm, alias_norm, score_cutoff=2) <= 2:
+            return canonical
     
     return query
 
 
+_ALIAS_CANONICALS = [canonical for canonical, aliases in ARTIST_ALIASES.items() for _ in aliases]
+_ALIAS_LOWERS = np.array([alias.lower() for aliases in ARTIST_ALIASES.values() for alias in aliases], dtype=object)
+_ALIAS_NORMS = [normalize_artist_name(alias) for aliases in ARTIST_ALIASES.values() for alias in aliases]
+_ALIAS_BY_NORM = {
+    alias_norm: next(
+        canonical for canonical, other in zip(_ALIAS_CANONICALS, _ALIAS_NORMS)
+        if levenshtein_distance(alias_norm, other, score_cutoff=2) <= 2
+    )
+    for alias_norm in _ALIAS_NORMS
+}
+
+
+INVALID_ARTIST_NAMES = frozenset({"nan", "none", "unknown", "[]", ""})
+
 DATA_PATH = Path(__file__).parent.parent.parent / "data" / "tracks_cleaned.csv"
+PARQUET_PATH = DATA_PATH.with_suffix(".parquet")
+FEATHER_PATH = DATA_PATH.with_suffix(".feather")
 FALLBACK_PATH = Path(__file__).parent.parent.parent / "data" / "tracks_with_language_FINAL.csv"
 
 
-@dataclass
+@dataclass(slots=True)
 class Track:
     spotify_id: str
     name: str
@@ -155,6 +258,7 @@ class Track:
     acousticness: float = 0.5
     tempo: float = 120.0
     distance: float = 0.0
+    verified: bool = False
     
     @property
     def spotify_url(self) -> str:
@@ -174,12 +278,23 @@ class Track:
             "valence": self.valence,
             "energy": self.energy,
             "danceability": self.danceability,
-            "distance": round(self.distance, 4)
+            "distance": round(self.distance, 4),
+            "verified": self.verified
         }
+    
+    def apply_validated(self, validated) -> "Track":
+        self.name = validated.name
+        self.artist = validated.artist
+        self.year = validated.year
+        self.genres = validated.genres
+        self.language = validated.language
+        self.verified = validated.is_verified
+        return self
 
 
 class MusicRecommender:
     FEATURE_COLUMNS = ["valence", "energy", "danceability", "acousticness", "tempo"]
+    DISPLAY_ARTIST_COLUMNS = ["artist_clean_norm", "artist_clean", "artist", "artists", "artist_list"]
     
     FEATURE_WEIGHTS = {
         "valence": 1.5,
@@ -189,6 +304,9 @@ class MusicRecommender:
         "tempo": 0.5
     }
     
+    FEATURE_DEFAULTS = {"tempo": 120.0}
+    FEATURE_SCALES = {"tempo": 140.0}
+    
     GENRE_MAPPING = {
         "pop": ["pop", "dance pop", "russian pop", "classic russian pop"],
         "dance": ["dance", "dance pop", "edm", "russian dance pop"],
@@ -214,35 +332,150 @@ class MusicRecommender:
     
     def __init__(self, data_path: Optional[Path] = None):
         self._df: Optional[pd.DataFrame] = None
+        self._features: Optional[np.ndarray] = None
+        self._all_positions: Optional[np.ndarray] = None
+        self._features_q8: Optional[np.ndarray] = None
+        self._q8_offset: Optional[np.ndarray] = None
+        self._q8_step: Optional[np.ndarray] = None
+        self._name_codes: Optional[np.ndarray] = None
+        self._display_artists: Optional[np.ndarray] = None
+        self._languages: Optional[np.ndarray] = None
+        self._genres: Optional[np.ndarray] = None
+        self._genre_index: Dict[str, np.ndarray] = {}
+        self._years: Optional[np.ndarray] = None
+        self._artist_indexes: Dict[str, Dict[str, Any]] = {}
         self._data_path = data_path or DATA_PATH
+        self._load_lock = threading.Lock()
         
     def _load_data(self) -> pd.DataFrame:
         if self._df is not None:
             return self._df
         
+        with self._load_lock:
+            if self._df is None:
+                self._read_dataset()
+        return self._df
+    
+    def _read_dataset(self):
         path = self._data_path
+        if path == DATA_PATH:
+            path = next((p for p in (FEATHER_PATH, PARQUET_PATH) if self._is_fresh(p, DATA_PATH)), path)
         if not path.exists():
             path = FALLBACK_PATH
         if not path.exists():
             raise FileNotFoundError(f"Dataset not found: {DATA_PATH} or {FALLBACK_PATH}")
         
-        logger.info(f"Loading dataset: {path}")
+        logger.info("Loading dataset: %s", path)
         
-        self._df = pd.read_csv(path, encoding="utf-8-sig", low_memory=False)
+        if path.suffix == ".feather":
+            df = self._read_feather(path)
+        elif path.suffix == ".parquet":
+            df = self._read_parquet(path)
+        else:
+            df = self._read_csv_cached(path)
+        
+        df = df.reset_index(drop=True)
         
         for col in self.FEATURE_COLUMNS:
-            if col in self._df.columns:
-                self._df[col] = pd.to_numeric(self._df[col], errors="coerce")
+            if col in df.columns:
+                df[col] = pd.to_numeric(df[col], errors="coerce")
+        
+        self._features = self._build_feature_matrix(df)
+        self._all_positions = np.arange(len(df))
+        self._all_positions.flags.writeable = False
+        self._features_q8, self._q8_offset, self._q8_step = self._quantize_features(self._features)
+        self._name_codes = pd.factorize(df["name"].astype(str).str.lower().str.strip())[0]
+        self._display_artists = self._build_display_artists(df)
         
-        self._df["genres_parsed"] = self._df["genres"].apply(self._parse_genres)
+        if "genres_parsed" not in df.columns:
+            df["genres_parsed"] = self._parse_genre_column(df["genres"])
         
-        if "language" in self._df.columns:
-            self._df["language"] = self._df["language"].fillna("other")
+        if "language" in df.columns:
+            df["language"] = df["language"].fillna("other")
         else:
-            self._df["language"] = "other"
+            df["language"] = "other"
+        df["language"] = df["language"].astype("category")
         
-        logger.info(f"Loaded {len(self._df)} tracks")
-        return self._df
+        self._languages = df["language"].to_numpy(dtype=object)
+        self._genres = df["genres_parsed"].to_numpy(dtype=object)
+        self._genre_index = self._build_genre_index(self._genres)
+        if "year" in df.columns:
+            self._years = pd.to_numeric(df["year"], errors="coerce").to_numpy(dtype=np.float64)
+        
+        self._artist_indexes = {col: self._build_artist_index(df[col]) for col in set(self._artist_columns(df))}
+        
+        logger.info("Loaded %d tracks", len(df))
+        self._df = df
+    
+    @staticmethod
+    def _artist_columns(df: pd.DataFrame) -> Tuple[str, str]:
+        artist_col = "artist_clean" if "artist_clean" in df.columns else "artist"
+        norm_col = "artist_clean_norm" if "artist_clean_norm" in df.columns else artist_col
+        return artist_col, norm_col
+    
+    @classmethod
+    def _read_feather(cls, path: Path) -> pd.DataFrame:
+        import pyarrow as pa
+        
+        with pa.memory_map(str(path), "r") as source:
+            table = pa.ipc.open_file(source).read_all()
+        
+        genres = None
+        if "genres_parsed" in table.column_names:
+            genres = table.column("genres_parsed").to_pylist()
+            table = table.drop_columns(["genres_parsed"])
+        
+        df = cls._from_nullable(table.to_pandas())
+        if genres is not None:
+            df["genres_parsed"] = genres
+        return df
+    
+    @staticmethod
+    def _is_fresh(path: Path, source: Path) -> bool:
+        """Производный файл существует и не старше исходного CSV."""
+        return path.exists() and (not source.exists() or path.stat().st_mtime >= source.stat().st_mtime)
+    
+    @classmethod
+    def _read_csv_cached(cls, path: Path) -> pd.DataFrame:
+        cache_path = path.with_suffix(".feather")
+        if cls._is_fresh(cache_path, path):
+            return cls._read_feather(cache_path)
+        
+        df = pd.read_csv(path, encoding="utf-8-sig", low_memory=False)
+        float_columns = df.select_dtypes("float64").columns
+        df[float_columns] = df[float_columns].astype("float32")
+        if "genres" in df.columns:
+            df["genres_parsed"] = cls._parse_genre_column(df["genres"])
+        
+        try:
+            import pyarrow as pa
+            
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            tmp_path = cache_path.with_suffix(".feather.tmp")
+            with pa.ipc.new_file(str(tmp_path), table.schema) as writer:
+                writer.write_table(table)
+            tmp_path.replace(cache_path)
+            logger.info("Cached dataset to %s", cache_path)
+        except Exception as e:
+            logger.warning("Failed to cache dataset as feather: %s", e)
+        
+        return df
+    
+    @classmethod
+    def _read_parquet(cls, path: Path) -> pd.DataFrame:
+        return cls._from_nullable(pd.read_parquet(path))
+    
+    @staticmethod
+    def _from_nullable(df: pd.DataFrame) -> pd.DataFrame:
+        for col, dtype in df.dtypes.items():
+            if getattr(dtype, "na_value", None) is not pd.NA:
+                continue
+            if pd.api.types.is_numeric_dtype(dtype):
+                df[col] = df[col].astype("float64")
+            else:
+                df[col] = df[col].astype(object).where(df[col].notna(), np.nan)
+        
+        return df
     
     @staticmethod
     def _parse_genres(x) -> List[str]:
@@ -260,6 +493,20 @@ class MusicRecommender:
             return [x.lower()]
         return []
     
+    @classmethod
+    def _parse_genre_column(cls, values: pd.Series) -> List[List[str]]:
+        codes, uniques = pd.factorize(values)
+        parsed = [cls._parse_genres(value) for value in uniques]
+        return [list(parsed[code]) if code >= 0 else [] for code in codes]
+    
+    @staticmethod
+    def _build_genre_index(genres: np.ndarray) -> Dict[str, np.ndarray]:
+        index: Dict[str, List[int]] = {}
+        for position, track_genres in enumerate(genres):
+            for genre in track_genres or ():
+                index.setdefault(genre.lower(), []).append(position)
+        return {genre: np.array(rows, dtype=np.int32) for genre, rows in index.items()}
+    
     def _expand_genres(self, genre_filters: List[str]) -> List[str]:
         expanded = set()
         for genre in genre_filters:
@@ -270,23 +517,204 @@ class MusicRecommender:
                 expanded.add(genre_lower)
         return list(expanded)
     
-    def _calculate_distance(self, df: pd.DataFrame, target_features: Dict[str, float]) -> pd.Series:
-        distance = pd.Series(0.0, index=df.index)
+    def _artist_index(self, column: str) -> Dict[str, Any]:
+        index = self._artist_indexes.get(column)
+        if index is None:
+            index = self._artist_indexes[column] = self._build_artist_index(self._load_data()[column])
+        return index
+    
+    @staticmethod
+    def _build_artist_index(values: pd.Series) -> Dict[str, Any]:
+        codes, uniques = pd.factorize(values.astype(str).str.lower())
+        codes = np.where(values.notna().to_numpy(), codes, -1)
+        
+        exact_keys, partial_texts, fuzzy_candidates = [], [], []
+        candidate_codes: Dict[str, int] = {}
+        
+        for raw in uniques:
+            parsed = None
+            if raw.startswith("["):
+                try:
+                    value = ast.literal_eval(raw)
+                    if isinstance(value, list):
+                        parsed = [str(a).lower() for a in value]
+                except:
+                    pass
+                exact_keys.append(parsed[0] if parsed is not None and len(parsed) == 1 else raw.strip("[]'\""))
+            else:
+                exact_keys.append(raw)
+            
+            names = (parsed or []) + [raw]
+            partial_texts.append("\x00".join(names))
+            fuzzy_candidates.append([candidate_codes.setdefault(n, len(candidate_codes)) for n in names])
+        
+        return {
+            "codes": codes,
+            "exact": np.array(exact_keys, dtype=object),
+            "partial": partial_texts,
+            "partial_blob": "\x01".join(partial_texts),
+            "partial_starts": np.cumsum([0] + [len(text) + 1 for text in partial_texts[:-1]]),
+            "fuzzy": fuzzy_candidates,
+            "candidates": [normalize_artist_name(c) for c in candidate_codes],
+        }
+    
+    def _artist_mask(self, column: str, mode: str, artist_lower: str) -> np.ndarray:
+        index = self._artist_index(column)
         
-        for feature, weight in self.FEATURE_WEIGHTS.items():
-            if feature not in df.columns or feature not in target_features:
+        if mode == "exact":
+            hits = index["exact"] == artist_lower
+        elif mode == "partial":
+            hits = self._partial_hits(index, artist_lower)
+        else:
+            candidate_hits = self._fuzzy_candidate_hits(normalize_artist_name(artist_lower), index["candidates"])
+            hits = np.fromiter(
+                (any(candidate_hits[c] for c in codes) for codes in index["fuzzy"]),
+                dtype=bool,
+                count=len(index["fuzzy"])
+            )
+        
+        codes = index["codes"]
+        return np.append(hits, False)[codes]
+    
+    @classmethod
+    def _build_display_artists(cls, df: pd.DataFrame) -> np.ndarray:
+        result = np.full(len(df), None, dtype=object)
+        
+        for col in cls.DISPLAY_ARTIST_COLUMNS:
+            if col not in df.columns:
                 continue
+            values = df[col]
+            codes, uniques = pd.factorize(values.astype(str))
+            names = np.array([_display_artist(raw) for raw in uniques] + [None], dtype=object)
+            codes = np.where(values.notna().to_numpy(), codes, -1)
             
-            target = target_features[feature]
-            
-            if feature == "tempo":
-                diff = (df[feature].fillna(120) - target) / 140
-            else:
-                diff = df[feature].fillna(0.5) - target
-            
-            distance += weight * (diff ** 2)
+            missing = result == None
+            result[missing] = names[codes[missing]]
+        
+        result[result == None] = "Unknown Artist"
+        return result
+    
+    @staticmethod
+    def _partial_hits(index: Dict[str, Any], artist_lower: str) -> np.ndarray:
+        texts = index["partial"]
+        blob, starts = index["partial_blob"], index["partial_starts"]
+        if "\x01" in artist_lower or blob.count(artist_lower) > len(texts) // 32:
+            return np.fromiter((artist_lower in text for text in texts), dtype=bool, count=len(texts))
+        
+        hits = np.zeros(len(texts), dtype=bool)
+        pos = blob.find(artist_lower)
+        while pos != -1:
+            k = int(np.searchsorted(starts, pos, side="right")) - 1
+            hits[k] = True
+            if k + 1 >= len(starts):
+                break
+            pos = blob.find(artist_lower, int(starts[k + 1]))
+        return hits
+    
+    @staticmethod
+    def _fuzzy_candidate_hits(query_norm: str, candidates: List[str], threshold: float = 0.7) -> np.ndarray:
+        if not query_norm or not candidates:
+            return np.zeros(len(candidates), dtype=bool)
+        
+        if not RAPIDFUZZ_AVAILABLE:
+            return np.fromiter(
+                (_fuzzy_norm_match(query_norm, c, threshold) for c in candidates),
+                dtype=bool,
+                count=len(candidates)
+            )
+        
+        scores = rf_process.cdist(
+            [query_norm],
+            candidates,
+            scorer=RFLevenshtein.normalized_similarity,
+            score_cutoff=threshold
+        )[0]
+        contained = np.fromiter(
+            (bool(c) and (query_norm in c or c in query_norm) for c in candidates),
+            dtype=bool,
+            count=len(candidates)
+        )
+        return contained | (scores >= threshold)
+    
+    def _build_feature_matrix(self, df: pd.DataFrame) -> np.ndarray:
+        features = np.zeros((len(df), len(self.FEATURE_COLUMNS)), dtype=np.float32)
+        
+        for j, feature in enumerate(self.FEATURE_COLUMNS):
+            if feature not in df.columns:
+                continue
+            column = df[feature].fillna(self.FEATURE_DEFAULTS.get(feature, 0.5))
+            features[:, j] = column.to_numpy(dtype=np.float32) / self.FEATURE_SCALES.get(feature, 1.0)
+        
+        return features
+    
+    @staticmethod
+    def _quantize_features(features: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Квантует матрицу признаков в uint8 по колонкам."""
+        if len(features) == 0:
+            zeros = np.zeros(features.shape[1])
+            return features.astype(np.uint8), zeros, zeros + 1.0
         
-        return np.sqrt(distance)
+        offset = features.min(axis=0).astype(np.float64)
+        step = (features.max(axis=0) - offset) / 255.0
+        step[step == 0] = 1.0
+        codes = np.rint((features - offset) / step).clip(0, 255).astype(np.uint8)
+        return codes, offset, step
+    
+    def _target_vector(self, target_features: Dict[str, float]) -> Tuple[np.ndarray, np.ndarray]:
+        df = self._load_data()
+        target = np.zeros(len(self.FEATURE_COLUMNS), dtype=np.float32)
+        weights = np.zeros(len(self.FEATURE_COLUMNS), dtype=np.float64)
+        
+        for j, feature in enumerate(self.FEATURE_COLUMNS):
+            if feature not in df.columns or feature not in target_features:
+                continue
+            target[j] = target_features[feature] / self.FEATURE_SCALES.get(feature, 1.0)
+            weights[j] = self.FEATURE_WEIGHTS[feature]
+        
+        return target, weights
+    
+    def _calculate_distance(self, positions: np.ndarray, target_features: Dict[str, float]) -> np.ndarray:
+        target, weights = self._target_vector(target_features)
+        if NUMBA_AVAILABLE:
+            with _kernel_guard():
+                return _weighted_distance(self._features, positions.astype(np.int64), target, weights)
+        
+        diff = self._features[positions] - target
+        return np.sqrt(np.einsum("ij,ij,j->i", diff, diff, weights))
+    
+    def _nearest_candidates(self, positions: np.ndarray, target_features: Dict[str, float], k: int) -> np.ndarray:
+        """Отбирает кандидатов по uint8-признакам, не теряя точный top-k."""
+        if len(positions) <= k:
+            return positions
+        
+        target, weights = self._target_vector(target_features)
+        step, offset = self._q8_step, self._q8_offset
+        target_q = np.rint((target - offset) / step).clip(0, 255)
+        
+        diff = self._features_q8[positions].astype(np.int16) - target_q.astype(np.int16)
+        coarse_sq = np.square(diff, dtype=np.int32).astype(np.float32) @ (weights * step * step).astype(np.float32)
+        
+        error = np.sqrt(np.dot(weights, (step / 2) ** 2))
+        error += np.sqrt(np.dot(weights, (target - (offset + target_q * step)) ** 2))
+        kth = np.sqrt(np.partition(coarse_sq, k - 1)[k - 1])
+        return positions[coarse_sq <= (kth + 2 * error + 1e-4) ** 2]
+    
+    @staticmethod
+    def _take(df: pd.DataFrame, column: str, rows: np.ndarray, default: Any) -> list:
+        if column not in df.columns:
+            return [default] * len(rows)
+        return df[column].to_numpy()[rows].tolist()
+    
+    @staticmethod
+    def _smallest(values: np.ndarray, k: int) -> np.ndarray:
+        if len(values) <= k:
+            return np.argsort(values, kind="stable")
+        
+        kth = np.partition(values, k - 1)[k - 1]
+        below = np.flatnonzero(values < kth)
+        ties = np.flatnonzero(values == kth)[:k - len(below)]
+        selected = np.concatenate((below, ties))
+        return selected[np.argsort(values[selected], kind="stable")]
     
     def recommend(
         self,
@@ -294,196 +722,127 @@ class MusicRecommender:
         filters: Optional[Dict[str, Any]] = None,
         top_k: int = 5
     ) -> List[Track]:
-        df = self._load_data().copy()
+        df = self._load_data()
         filters = filters or {}
+        positions = self._all_positions
         
         artist = filters.get("artist")
         artist_found = False
-        artist_df = None
         
         if artist:
             artist = resolve_artist_alias(artist)
-            logger.info(f"Resolved artist: {artist}")
+            logger.info("Resolved artist: %s", artist)
             artist_lower = artist.lower().strip()
-            artist_col = "artist_clean" if "artist_clean" in df.columns else "artist"
-            norm_col = "artist_clean_norm" if "artist_clean_norm" in df.columns else artist_col
-            
-            def match_artist_exact(raw):
-                if pd.isna(raw):
-                    return False
-                raw_str = str(raw).lower()
-                if raw_str.startswith("["):
-                    try:
-                        parsed = ast.literal_eval(raw_str)
-                        if isinstance(parsed, list) and len(parsed) == 1:
-                            return str(parsed[0]).lower() == artist_lower
-                    except:
-                        pass
-                    return raw_str.strip("[]'\"") == artist_lower
-                return raw_str == artist_lower
+            artist_col, norm_col = self._artist_columns(df)
             
-            def match_artist_partial(raw):
-                if pd.isna(raw):
-                    return False
-                raw_str = str(raw).lower()
-                if raw_str.startswith("["):
-                    try:
-                        parsed = ast.literal_eval(raw_str)
-                        if isinstance(parsed, list):
-                            for a in parsed:
-                                if artist_lower in str(a).lower() or str(a).lower() == artist_lower:
-                                    return True
-                    except:
-                        pass
-                return artist_lower in raw_str
-            
-            def match_artist_fuzzy(raw):
-                if pd.isna(raw):
-                    return False
-                raw_str = str(raw).lower()
-                if raw_str.startswith("["):
-                    try:
-                        parsed = ast.literal_eval(raw_str)
-                        if isinstance(parsed, list):
-                            for a in parsed:
-                                if fuzzy_artist_match(artist_lower, str(a).lower()):
-                                    return True
-                    except:
-                        pass
-                return fuzzy_artist_match(artist_lower, raw_str)
-            
-            exact_match = df[df[artist_col].apply(match_artist_exact)]
-            if len(exact_match) > 0:
-                artist_df = exact_match
-                artist_found = True
-                logger.info(f"Found {len(exact_match)} tracks by artist '{artist}' (exact)")
-            else:
-                partial_match = df[df[artist_col].apply(match_artist_partial)]
-                if len(partial_match) > 0:
-                    artist_df = partial_match
+            for mode, col in (("exact", artist_col), ("partial", artist_col), ("fuzzy", norm_col)):
+                matched = np.flatnonzero(self._artist_mask(col, mode, artist_lower))
+                if len(matched) > 0:
+                    positions = matched
                     artist_found = True
-                    logger.info(f"Found {len(partial_match)} tracks by artist '{artist}' (partial)")
-                else:
-                    fuzzy_match = df[df[norm_col].apply(match_artist_fuzzy)]
-                    if len(fuzzy_match) > 0:
-                        artist_df = fuzzy_match
-                        artist_found = True
-                        logger.info(f"Found {len(fuzzy_match)} tracks by artist '{artist}' (fuzzy)")
-                    else:
-                        logger.warning(f"No tracks found for artist '{artist}', searching in all tracks")
+                    logger.info("Found %d tracks by artist '%s' (%s)", len(matched), artist, mode)
+                    break
+            else:
+                logger.warning("No tracks found for artist '%s', searching in all tracks", artist)
             
-            if artist_found and len(artist_df) >= top_k:
-                logger.info(f"Artist mode: skipping other filters, using only artist tracks")
-                df = artist_df
-            elif artist_found:
-                df = artist_df
+            if artist_found and len(positions) >= top_k:
+                logger.info("Artist mode: skipping other filters, using only artist tracks")
         
         if not artist_found:
             language = filters.get("language")
             if language and language != "other" and language != "any":
-                filtered = df[df["language"] == language]
+                filtered = positions[self._languages[positions] == language]
                 if len(filtered) >= top_k:
-                    df = filtered
+                    positions = filtered
             
             genres = filters.get("genres")
             if genres:
-                expanded_genres = self._expand_genres(genres)
-                
-                def has_genre(track_genres):
-                    if not track_genres:
-                        return False
-                    track_set = set(g.lower() for g in track_genres)
-                    return bool(track_set & set(expanded_genres))
-                
-                filtered = df[df["genres_parsed"].apply(has_genre)]
+                genre_mask = np.zeros(len(df), dtype=bool)
+                for genre in set(self._expand_genres(genres)):
+                    rows = self._genre_index.get(genre)
+                    if rows is not None:
+                        genre_mask[rows] = True
+                filtered = positions[genre_mask[positions]]
                 if len(filtered) >= top_k:
-                    df = filtered
+                    positions = filtered
             
             year_start = filters.get("year_start")
             year_end = filters.get("year_end")
             
-            if year_start and "year" in df.columns:
-                filtered = df[df["year"] >= year_start]
+            if year_start and self._years is not None:
+                filtered = positions[self._years[positions] >= year_start]
                 if len(filtered) >= top_k:
-                    df = filtered
-            if year_end and "year" in df.columns:
-                filtered = df[df["year"] <= year_end]
+                    positions = filtered
+            if year_end and self._years is not None:
+                filtered = positions[self._years[positions] <= year_end]
                 if len(filtered) >= top_k:
-                    df = filtered
+                    positions = filtered
         
-        if len(df) < top_k and not artist_found:
-            logger.warning(f"Too few tracks ({len(df)}) after filtering, resetting filters")
-            df = self._load_data().copy()
+        if len(positions) < top_k and not artist_found:
+            logger.warning("Too few tracks (%d) after filtering, resetting filters", len(positions))
+            positions = self._all_positions
             
             language = filters.get("language")
             if language and language != "other":
-                filtered = df[df["language"] == language]
+                filtered = positions[self._languages == language]
                 if len(filtered) >= top_k:
-                    df = filtered
+                    positions = filtered
         
-        df["distance"] = self._calculate_distance(df, features)
+        positions = positions[~pd.Series(self._name_codes[positions]).duplicated().to_numpy()]
+        positions = self._nearest_candidates(positions, features, top_k)
+        distances = self._calculate_distance(positions, features)
         
-        df["name_lower"] = df["name"].str.lower().str.strip()
-        df = df.drop_duplicates(subset=["name_lower"], keep="first")
+        nearest = self._smallest(distances, top_k)
+        rows = positions[nearest]
         
-        df = df.nsmallest(top_k * 2, "distance")
-        
-        tracks = []
-        seen_names = set()
-        
-        for _, row in df.iterrows():
-            name = str(row.get("name", "Unknown"))
-            name_key = name.lower().strip()
-            
-            if name_key in seen_names:
-                continue
-            seen_names.add(name_key)
-            
-            track_artist = ""
-            for col in ["artist_clean_norm", "artist_clean", "artist", "artists", "artist_list"]:
-                if col in row.index and pd.notna(row[col]):
-                    raw = str(row[col])
-                    if raw.startswith("[") and raw.endswith("]"):
-                        try:
-                            parsed = ast.literal_eval(raw)
-                            if isinstance(parsed, list) and parsed:
-                                track_artist = parsed[0] if len(parsed) == 1 else ", ".join(parsed)
-                        except:
-                            track_artist = raw.strip("[]'\"")
-                    else:
-                        track_artist = raw
-                    if track_artist and track_artist.lower() not in ["nan", "none", "unknown", "[]", ""]:
-                        break
-            if not track_artist or track_artist.lower() in ["nan", "none", "unknown", "[]", ""]:
-                track_artist = "Unknown Artist"
-            
-            track = Track(
-                spotify_id=str(row.get("spotify_id", "")),
-                name=name,
-                artist=track_artist,
-                year=int(row["year"]) if pd.notna(row.get("year")) else None,
-                genres=row.get("genres_parsed", []),
-                language=str(row.get("language", "other")),
-                valence=float(row.get("valence", 0.5)),
-                energy=float(row.get("energy", 0.5)),
-                danceability=float(row.get("danceability", 0.5)),
-                acousticness=float(row.get("acousticness", 0.5)),
-                tempo=float(row.get("tempo", 120)),
-                distance=float(row.get("distance", 0))
+        return [
+            Track(
+                spotify_id=str(spotify_id),
+                name=str(name),
+                artist=artist,
+                year=int(year) if pd.notna(year) else None,
+                genres=genres,
+                language=str(language),
+                valence=float(valence),
+                energy=float(energy),
+                danceability=float(danceability),
+                acousticness=float(acousticness),
+                tempo=float(tempo),
+                distance=float(distance)
             )
-            tracks.append(track)
-            
-            if len(tracks) >= top_k:
-                break
-        
-        return tracks
+            for spotify_id, name, artist, year, genres, language, valence, energy, danceability, acousticness, tempo, distance in zip(
+                self._take(df, "spotify_id", rows, ""),
+                self._take(df, "name", rows, "Unknown"),
+                self._display_artists[rows],
+                self._take(df, "year", rows, None),
+                self._take(df, "genres_parsed", rows, []),
+                self._take(df, "language", rows, "other"),
+                self._take(df, "valence", rows, 0.5),
+                self._take(df, "energy", rows, 0.5),
+                self._take(df, "danceability", rows, 0.5),
+                self._take(df, "acousticness", rows, 0.5),
+                self._take(df, "tempo", rows, 120),
+                distances[nearest].tolist()
+            )
+        ]
 
 
 _recommender_instance: Optional[MusicRecommender] = None
+_recommender_lock = threading.Lock()
+
+
+def _preload(recommender: MusicRecommender):
+    try:
+        recommender._load_data()
+    except Exception as e:
+        logger.error("Background dataset preload failed: %s", e)
 
 
 def get_music_recommender() -> MusicRecommender:
     global _recommender_instance
     if _recommender_instance is None:
-        _recommender_instance = MusicRecommender()
+        with _recommender_lock:
+            if _recommender_instance is None:
+                _recommender_instance = MusicRecommender()
+                threading.Thread(target=_preload, args=(_recommender_instance,), name="recommender-preload", daemon=True).start()
     return _recommender_instance
@@ -1,29 +1,201 @@
-import os
+import time
+import zlib
+import sqlite3
+import hashlib
 import logging
-from typing import Optional, List, Dict, Any
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional, List, Dict, Any, Tuple
+
+from config.settings import settings, SPOTIFY_CACHE_PATH
+from src.llm.cache import json_dumps, json_loads
 
 logger = logging.getLogger(__name__)
 
 try:
+    import requests
     import spotipy
+    from requests.adapters import HTTPAdapter
     from spotipy.oauth2 import SpotifyClientCredentials
     SPOTIPY_AVAILABLE = True
 except ImportError:
     SPOTIPY_AVAILABLE = False
 
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+SPOTIFY_CACHE_PREFIX = "spot:"
+SPOTIFY_CACHE_TTL = 15 * 60
+SPOTIFY_CACHE_SIZE = 512
+COMPRESS_THRESHOLD = 1024
+SPOTIFY_BATCH_SIZE = 50
+SPOTIFY_BATCH_CONCURRENCY = 8
+SPOTIFY_POOL_SIZE = 16
+ARTIST_GENRES_CACHE_PREFIX = "spotgenres:"
+ARTIST_GENRES_CACHE_TTL = 24 * 60 * 60
+ARTIST_GENRES_CACHE_SIZE = 4096
+
+_batch_pool = ThreadPoolExecutor(max_workers=SPOTIFY_BATCH_CONCURRENCY, thread_name_prefix="spotify")
+_batch_slots = threading.BoundedSemaphore(SPOTIFY_BATCH_CONCURRENCY)
+
+
+class SpotifyCache:
+    def __init__(
+        self,
+        redis_url: Optional[str] = None,
+        prefix: str = SPOTIFY_CACHE_PREFIX,
+        ttl: int = SPOTIFY_CACHE_TTL,
+        maxsize: int = SPOTIFY_CACHE_SIZE,
+        disk_path: Optional[Path] = None
+    ):
+        self.prefix = prefix
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._local: Dict[str, Tuple[float, str]] = {}
+        self._lock = threading.Lock()
+        self._redis = None
+        self._disk: Optional[sqlite3.Connection] = None
+        self._disk_lock = threading.Lock()
+        
+        if redis_url and REDIS_AVAILABLE:
+            self._redis = redis.Redis.from_url(redis_url, socket_timeout=0.5)
+        elif redis_url:
+            logger.warning("redis is not installed, Spotify cache falls back to disk")
+        
+        if self._redis is None and disk_path is not None:
+            self._disk = self._open_disk(disk_path)
+    
+    @staticmethod
+    def _open_disk(path: Path) -> Optional[sqlite3.Connection]:
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=1.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, expires REAL NOT NULL, value BLOB NOT NULL)")
+            conn.execute("DELETE FROM cache WHERE expires < ?", (time.time(),))
+            return conn
+        except (OSError, sqlite3.Error) as e:
+            logger.warning("Spotify disk cache is unavailable: %s", e)
+            return None
+    
+    def _remote_get(self, key: str) -> Optional[bytes]:
+        if self._redis is not None:
+            return self._redis.get(key)
+        if self._disk is not None:
+            with self._disk_lock:
+                row = self._disk.execute(
+                    "SELECT value FROM cache WHERE key = ? AND expires >= ?", (key, time.time())
+                ).fetchone()
+            return row[0] if row else None
+        return None
+    
+    def _remote_set(self, key: str, data: bytes):
+        if self._redis is not None:
+            self._redis.set(key, data, ex=self.ttl)
+        elif self._disk is not None:
+            with self._disk_lock:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO cache (key, expires, value) VALUES (?, ?, ?)",
+                    (key, time.time() + self.ttl, data)
+                )
+    
+    def key(self, method: str, *parts) -> str:
+        raw = "|".join([method, *(str(p) for p in parts)])
+        return self.prefix + hashlib.md5(raw.encode("utf-8")).hexdigest()
+    
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._local.pop(key, None)
+            if entry is not None and entry[0] >= time.time():
+                self._local[key] = entry
+                return json_loads(entry[1])
+        
+        if self._redis is None and self._disk is None:
+            return None
+        
+        try:
+            raw = self._remote_get(key)
+        except Exception as e:
+            logger.warning("Spotify cache read failed: %s", e)
+            return None
+        
+        if raw is None:
+            return None
+        
+        payload = (zlib.decompress(raw[1:]) if raw[:1] == b"z" else raw[1:]).decode("utf-8")
+        self._set_local(key, payload)
+        return json_loads(payload)
+    
+    def set(self, key: str, value: Any):
+        payload = json_dumps(value)
+        self._set_local(key, payload)
+        if self._redis is None and self._disk is None:
+            return
+        
+        data = payload.encode("utf-8")
+        data = b"z" + zlib.compress(data) if len(data) > COMPRESS_THRESHOLD else b"j" + data
+        try:
+            self._remote_set(key, data)
+        except Exception as e:
+            logger.warning("Spotify cache write failed: %s", e)
+    
+    def _set_local(self, key: str, payload: str):
+        with self._lock:
+            self._local.pop(key, None)
+            if len(self._local) >= self.maxsize:
+                self._local.pop(next(iter(self._local)), None)
+            self._local[key] = (time.time() + self.ttl, payload)
+    
+    def invalidate_prefix(self, prefix: Optional[str] = None) -> int:
+        prefix = prefix or self.prefix
+        with self._lock:
+            stale = [key for key in self._local if key.startswith(prefix)]
+            for key in stale:
+                del self._local[key]
+        removed = len(stale)
+        
+        if self._redis is not None:
+            try:
+                keys = list(self._redis.scan_iter(match=f"{prefix}*", count=500))
+                if keys:
+                    removed = max(removed, self._redis.delete(*keys))
+            except Exception as e:
+                logger.warning("Spotify cache invalidation failed: %s", e)
+        elif self._disk is not None:
+            try:
+                with self._disk_lock:
+                    cursor = self._disk.execute("DELETE FROM cache WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+                removed = max(removed, cursor.rowcount)
+            except sqlite3.Error as e:
+                logger.warning("Spotify cache invalidation failed: %s", e)
+        
+        return removed
+
 
 class SpotifyClient:
     def __init__(self):
         self._client = None
         self._available = False
+        self.cache = SpotifyCache(redis_url=settings.redis_url, disk_path=SPOTIFY_CACHE_PATH)
+        self.genres_cache = SpotifyCache(
+            redis_url=settings.redis_url,
+            prefix=ARTIST_GENRES_CACHE_PREFIX,
+            ttl=ARTIST_GENRES_CACHE_TTL,
+            maxsize=ARTIST_GENRES_CACHE_SIZE,
+            disk_path=SPOTIFY_CACHE_PATH
+        )
     
     def _get_client(self):
         if not SPOTIPY_AVAILABLE:
             return None
         
         if self._client is None:
-            client_id = os.getenv("SPOTIFY_CLIENT_ID")
-            client_secret = os.getenv("SPOTIFY_CLIENT_SECRET")
+            client_id = settings.spotify_client_id
+            client_secret = settings.spotify_client_secret
             
             if not client_id or not client_secret:
                 logger.warning("Spotify credentials not found")
@@ -34,10 +206,12 @@ class SpotifyClient:
                     client_id=client_id,
                     client_secret=client_secret
                 )
-                self._client = spotipy.Spotify(auth_manager=auth_manager)
+                session = requests.Session()
+                session.mount("https://", HTTPAdapter(pool_maxsize=SPOTIFY_POOL_SIZE))
+                self._client = spotipy.Spotify(auth_manager=auth_manager, requests_session=session)
                 self._available = True
             except Exception as e:
-                logger.error(f"Failed to init Spotify client: {e}")
+                logger.error("Failed to init Spotify client: %s", e)
                 return None
         
         return self._client
@@ -55,10 +229,15 @@ class SpotifyClient:
         if not client:
             return []
         
+        cache_key = self.cache.key("search_tracks", query, market, limit)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         try:
             results = client.search(q=query, type="track", limit=limit, market=market)
         except Exception as e:
-            logger.error(f"Spotify search error: {e}")
+            logger.error("Spotify search error: %s", e)
             return []
         
         tracks = []
@@ -78,6 +257,7 @@ class SpotifyClient:
             }
             tracks.append(track)
         
+        self.cache.set(cache_key, tracks)
         return tracks
     
     def search_by_mood(
@@ -113,12 +293,35 @@ class SpotifyClient:
         if not client:
             return []
         
+        cache_key = self.genres_cache.key("artist_genres", artist_id)
+        cached = self.genres_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         try:
             artist = client.artist(artist_id)
-            return artist.get("genres", [])
         except Exception as e:
-            logger.error(f"Error getting artist genres: {e}")
+            logger.error("Error getting artist genres: %s", e)
             return []
+        
+        genres = artist.get("genres", [])
+        self.genres_cache.set(cache_key, genres)
+        return genres
+    
+    @staticmethod
+    def _fetch_batches(fetch: Callable[[List[str]], list], ids: List[str], what: str) -> list:
+        batches = [ids[i:i+SPOTIFY_BATCH_SIZE] for i in range(0, len(ids), SPOTIFY_BATCH_SIZE)]
+        
+        def run(batch: List[str]) -> list:
+            try:
+                with _batch_slots:
+                    return fetch(batch)
+            except Exception as e:
+                logger.error("Error getting %s batch: %s", what, e)
+                return []
+        
+        chunks = [run(batch) for batch in batches] if len(batches) <= 1 else _batch_pool.map(run, batches)
+        return [item for chunk in chunks for item in chunk]
     
     def get_artists_genres_batch(self, artist_ids: List[str]) -> Dict[str, List[str]]:
         client = self._get_client()
@@ -126,17 +329,20 @@ class SpotifyClient:
             return {}
         
         result = {}
-        batch_size = 50
+        missing = []
+        for artist_id in artist_ids:
+            cached = self.genres_cache.get(self.genres_cache.key("artist_genres", artist_id))
+            if cached is not None:
+                result[artist_id] = cached
+            else:
+                missing.append(artist_id)
         
-        for i in range(0, len(artist_ids), batch_size):
-            batch = artist_ids[i:i+batch_size]
-            try:
-                artists_data = client.artists(batch)
-                for artist in artists_data.get("artists", []):
-                    if artist:
-                        result[artist["id"]] = artist.get("genres", [])
-            except Exception as e:
-                logger.error(f"Error getting artists batch: {e}")
+        def fetch(batch: List[str]) -> list:
+            return [(a["id"], a.get("genres", [])) for a in client.artists(batch).get("artists", []) if a]
+        
+        for artist_id, genres in self._fetch_batches(fetch, missing, "artists"):
+            result[artist_id] = genres
+            self.genres_cache.set(self.genres_cache.key("artist_genres", artist_id), genres)
         
         return result
     
@@ -145,9 +351,14 @@ class SpotifyClient:
         if not client:
             return None
         
+        cache_key = self.cache.key("track_info", track_id)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         try:
             track = client.track(track_id)
-            return {
+            info = {
                 "spotify_id": track["id"],
                 "name": track["name"],
                 "artist": ", ".join([a["name"] for a in track["artists"]]),
@@ -157,43 +368,44 @@ class SpotifyClient:
                 "spotify_url": track["external_urls"]["spotify"],
             }
         except Exception as e:
-            logger.error(f"Error getting track info: {e}")
+            logger.error("Error getting track info: %s", e)
             return None
+        
+        self.cache.set(cache_key, info)
+        return info
     
     def get_tracks_batch(self, track_ids: List[str]) -> List[Dict[str, Any]]:
         client = self._get_client()
         if not client:
             return []
         
-        results = []
-        batch_size = 50
-        
-        for i in range(0, len(track_ids), batch_size):
-            batch = track_ids[i:i+batch_size]
-            try:
-                tracks_data = client.tracks(batch)
-                for track in tracks_data.get("tracks", []):
-                    if track:
-                        results.append({
-                            "spotify_id": track["id"],
-                            "name": track["name"],
-                            "artist": ", ".join([a["name"] for a in track["artists"]]),
-                            "release_date": track["album"].get("release_date", ""),
-                            "popularity": track["popularity"],
-                            "spotify_url": track["external_urls"]["spotify"],
-                        })
-            except Exception as e:
-                logger.error(f"Error getting tracks batch: {e}")
+        def fetch(batch: List[str]) -> list:
+            results = []
+            for track in client.tracks(batch).get("tracks", []):
+                if track:
+                    results.append({
+                        "spotify_id": track["id"],
+                        "name": track["name"],
+                        "artist": ", ".join([a["name"] for a in track["artists"]]),
+                        "artist_ids": [a["id"] for a in track["artists"]],
+                        "release_date": track["album"].get("release_date", ""),
+                        "popularity": track["popularity"],
+                        "spotify_url": track["external_urls"]["spotify"],
+                    })
+            return results
         
-        return results
+        return self._fetch_batches(fetch, track_ids, "tracks")
 
 
 _spotify_client: Optional[SpotifyClient] = None
+_spotify_lock = threading.Lock()
 
 
 def get_spotify_client() -> SpotifyClient:
     global _spotify_client
     if _spotify_client is None:
-        _spotify_client = SpotifyClient()
+        with _spotify_lock:
+            if _spotify_client is None:
+                _spotify_client = SpotifyClient()
     return _spotify_client
 
@@ -1,18 +1,34 @@
+import asyncio
 import logging
 import re
-from typing import List, Dict, Any, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
 from dataclasses import dataclass
 
-from src.spotify_client import get_spotify_client
-from src.llm.gigachat import get_gigachat_service
+from config.settings import settings, TRACK_ANALYSIS_CACHE_PATH
+from src.spotify_client import SpotifyCache, get_spotify_client
+from src.llm.gigachat import JSON_FENCE_RE, get_gigachat_service, json_loads
 
 logger = logging.getLogger(__name__)
 
 CYRILLIC_PATTERN = re.compile(r'[а-яА-ЯёЁ]')
-LATIN_PATTERN = re.compile(r'[a-zA-Z]')
+NON_LATIN_BYTES = bytes(b for b in range(256) if not (0x41 <= b <= 0x5A or 0x61 <= b <= 0x7A))
+SPOTIFY_ID_PATTERN = re.compile(r'[0-9A-Za-z]{22}')
+YEAR_PATTERN = re.compile(r'\d{4}')
+UNKNOWN_ARTIST_NAMES = frozenset({"unknown", "nan", "none", ""})
+INVALID_SPOTIFY_IDS = frozenset({"nan", "None", ""})
+FALLBACK_LANGUAGES = frozenset({"en", "instrumental"})
 
+TRACK_ANALYSIS_CACHE_PREFIX = "trackllm:"
+TRACK_ANALYSIS_CACHE_TTL = 30 * 24 * 60 * 60
+TRACK_ANALYSIS_CACHE_SIZE = 10_000
+TRACK_ANALYSIS_CHUNK_SIZE = 25
 
-@dataclass
+_analysis_pool = ThreadPoolExecutor(max_workers=settings.task_concurrency, thread_name_prefix="track-analysis")
+
+
+@dataclass(slots=True)
 class ValidatedTrack:
     spotify_id: str
     name: str
@@ -41,6 +57,13 @@ class TrackValidator:
     def __init__(self):
         self.spotify = get_spotify_client()
         self._gigachat = None
+        self.analysis_cache = SpotifyCache(
+            redis_url=settings.redis_url,
+            prefix=TRACK_ANALYSIS_CACHE_PREFIX,
+            ttl=TRACK_ANALYSIS_CACHE_TTL,
+            maxsize=TRACK_ANALYSIS_CACHE_SIZE,
+            disk_path=TRACK_ANALYSIS_CACHE_PATH
+        )
     
     @property
     def gigachat(self):
@@ -48,12 +71,22 @@ class TrackValidator:
             self._gigachat = get_gigachat_service()
         return self._gigachat
     
+    @staticmethod
+    def _count_scripts(text: str) -> Tuple[int, int]:
+        if not text:
+            return 0, 0
+        latin_count = len(text.encode("utf-8", "surrogatepass").translate(None, NON_LATIN_BYTES))
+        if text.isascii():
+            return 0, latin_count
+        return len(CYRILLIC_PATTERN.findall(text)), latin_count
+    
     def detect_language_from_text(self, text: str) -> str:
         if not text:
             return "other"
-        
-        cyrillic_count = len(CYRILLIC_PATTERN.findall(text))
-        latin_count = len(LATIN_PATTERN.findall(text))
+        return self._language_from_counts(*self._count_scripts(text))
+    
+    @staticmethod
+    def _language_from_counts(cyrillic_count: int, latin_count: int) -> str:
         total = cyrillic_count + latin_count
         
         if total == 0:
@@ -67,45 +100,67 @@ class TrackValidator:
         return "other"
     
     def verify_with_spotify(self, track_id: str) -> Optional[Dict[str, Any]]:
-        if not self.spotify.is_available():
-            return None
+        return self.fetch_spotify_info([track_id]).get(track_id)
+    
+    def fetch_spotify_info(self, track_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        track_ids = list(dict.fromkeys(t for t in track_ids if t and SPOTIFY_ID_PATTERN.fullmatch(t)))
+        if not track_ids or not self.spotify.is_available():
+            return {}
         
         try:
-            info = self.spotify.get_track_info(track_id)
-            if info:
-                artist_ids = []
-                search_result = self.spotify.search_tracks(
-                    f"{info['artist']} {info['name']}", 
-                    limit=1
-                )
-                if search_result:
-                    artist_ids = search_result[0].get("artist_ids", [])
-                
-                genres = []
-                if artist_ids:
-                    genres_map = self.spotify.get_artists_genres_batch(artist_ids[:1])
-                    for g in genres_map.values():
-                        genres.extend(g)
-                
-                return {
-                    "name": info["name"],
-                    "artist": info["artist"],
-                    "release_date": info.get("release_date", ""),
-                    "spotify_url": info["spotify_url"],
-                    "genres": genres,
-                    "verified": True
-                }
+            infos = self.spotify.get_tracks_batch(track_ids)
+            first_artists = list(dict.fromkeys(info["artist_ids"][0] for info in infos if info.get("artist_ids")))
+            genres_map = self.spotify.get_artists_genres_batch(first_artists) if first_artists else {}
         except Exception as e:
-            logger.warning(f"Spotify verification failed for {track_id}: {e}")
+            logger.warning("Spotify batch verification failed: %s", e)
+            return {}
         
-        return None
+        return {
+            info["spotify_id"]: {
+                "name": info["name"],
+                "artist": info["artist"],
+                "release_date": info.get("release_date", ""),
+                "spotify_url": info["spotify_url"],
+                "genres": list(genres_map.get(info["artist_ids"][0], [])) if info.get("artist_ids") else [],
+                "verified": True
+            }
+            for info in infos
+        }
+    
+    def _analysis_key(self, track: Dict) -> str:
+        return self.analysis_cache.key("analyze_track", track.get("artist", "Unknown"), track.get("name", "Unknown"))
+    
+    @staticmethod
+    def _apply_analysis(track: Dict, analysis: Dict[str, Any]):
+        if analysis.get("language"):
+            track["language_suggested"] = analysis["language"]
+        if analysis.get("suggested_artist"):
+            track["artist_suggested"] = analysis["suggested_artist"]
     
     def analyze_with_gigachat(self, tracks: List[Dict]) -> List[Dict]:
         if not tracks:
             return tracks
         
+        pending = []
+        for track in tracks:
+            cached = self.analysis_cache.get(self._analysis_key(track))
+            if cached is not None:
+                self._apply_analysis(track, cached)
+            else:
+                pending.append(track)
+        
+        chunks = [pending[i:i+TRACK_ANALYSIS_CHUNK_SIZE] for i in range(0, len(pending), TRACK_ANALYSIS_CHUNK_SIZE)]
+        if len(chunks) <= 1:
+            for chunk in chunks:
+                self._analyze_chunk(chunk)
+        else:
+            list(_analysis_pool.map(self._analyze_chunk, chunks))
+        
+        return tracks
+    
+    def _analyze_chunk(self, pending: List[Dict]):
         tracks_info = []
-        for i, t in enumerate(tracks[:5]):
+        for i, t in enumerate(pending):
             tracks_info.append(f"{i+1}. {t.get('artist', 'Unknown')} - {t.get('name', 'Unknown')}")
         
         prompt = f"""Проанализируй эти треки и определи для каждого:
@@ -123,29 +178,17 @@ class TrackValidator:
         
         try:
             response = self.gigachat.chat(prompt)
-            
-            import json
-            clean_response = response.strip()
-            if clean_response.startswith("```"):
-                clean_response = clean_response.split("```")[1]
-                if clean_response.startswith("json"):
-                    clean_response = clean_response[4:]
-            
-            data = json.loads(clean_response)
+            data = json_loads(JSON_FENCE_RE.sub("", response).strip())
             
             for item in data.get("tracks", []):
                 idx = item.get("index", 0) - 1
-                if 0 <= idx < len(tracks):
-                    if item.get("language"):
-                        tracks[idx]["language_suggested"] = item["language"]
-                    if item.get("suggested_artist"):
-                        tracks[idx]["artist_suggested"] = item["suggested_artist"]
-            
-            return tracks
+                if 0 <= idx < len(pending):
+                    analysis = {"language": item.get("language"), "suggested_artist": item.get("suggested_artist")}
+                    self._apply_analysis(pending[idx], analysis)
+                    self.analysis_cache.set(self._analysis_key(pending[idx]), analysis)
             
         except Exception as e:
-            logger.warning(f"GigaChat analysis failed: {e}")
-            return tracks
+            logger.warning("GigaChat analysis failed: %s", e)
     
     def validate_tracks(
         self, 
@@ -153,84 +196,76 @@ class TrackValidator:
         verify_spotify: bool = True,
         use_gigachat: bool = False
     ) -> List[ValidatedTrack]:
-        validated = []
+        spotify_infos = {}
+        if verify_spotify:
+            spotify_infos = self.fetch_spotify_info([track.get("spotify_id", "") for track in tracks])
         
-        for track in tracks:
-            name = track.get("name", "")
-            artist = track.get("artist", "")
-            spotify_id = track.get("spotify_id", "")
-            year = track.get("year")
-            language = track.get("language", "other")
-            genres = track.get("genres", [])
-            spotify_url = track.get("spotify_url", "")
-            
-            is_verified = False
-            verification_source = "dataset"
-            
-            if verify_spotify and spotify_id and self.spotify.is_available():
-                spotify_info = self.verify_with_spotify(spotify_id)
-                if spotify_info:
-                    name = spotify_info["name"]
-                    artist = spotify_info["artist"]
-                    spotify_url = spotify_info["spotify_url"]
-                    if spotify_info["genres"]:
-                        genres = spotify_info["genres"]
-                    if spotify_info.get("release_date"):
-                        try:
-                            year = int(spotify_info["release_date"][:4])
-                        except:
-                            pass
-                    is_verified = True
-                    verification_source = "spotify"
-            
-            detected_lang = self.detect_language_from_text(f"{name} {artist}")
-            if detected_lang != "other":
-                language = detected_lang
-            elif CYRILLIC_PATTERN.search(name) or CYRILLIC_PATTERN.search(artist):
-                language = "ru"
-            elif not CYRILLIC_PATTERN.search(name) and not CYRILLIC_PATTERN.search(artist):
-                if language not in ["en", "instrumental"]:
-                    language = "en"
-            
-            if not artist or artist.lower() in ["unknown", "nan", "none", ""]:
-                artist = "Unknown Artist"
-            
-            if not spotify_url and spotify_id and spotify_id not in ["nan", "None", ""]:
-                spotify_url = f"https://open.spotify.com/track/{spotify_id}"
-            
-            validated.append(ValidatedTrack(
-                spotify_id=spotify_id,
-                name=name,
-                artist=artist,
-                year=year,
-                language=language,
-                genres=genres if isinstance(genres, list) else [],
-                spotify_url=spotify_url,
-                is_verified=is_verified,
-                verification_source=verification_source
-            ))
+        return [self._validate_track(track, spotify_infos.get(track.get("spotify_id", ""))) for track in tracks]
+    
+    def _validate_track(self, track: Dict, spotify_info: Optional[Dict[str, Any]]) -> ValidatedTrack:
+        name = track.get("name", "")
+        artist = track.get("artist", "")
+        spotify_id = track.get("spotify_id", "")
+        year = track.get("year")
+        language = track.get("language", "other")
+        genres = track.get("genres", [])
+        spotify_url = track.get("spotify_url", "")
         
-        return validated
+        is_verified = False
+        verification_source = "dataset"
+        
+        if spotify_info:
+            name = spotify_info["name"]
+            artist = spotify_info["artist"]
+            spotify_url = spotify_info["spotify_url"]
+            if spotify_info["genres"]:
+                genres = spotify_info["genres"]
+            year_match = YEAR_PATTERN.match(spotify_info.get("release_date") or "")
+            if year_match:
+                year = int(year_match.group())
+            is_verified = True
+            verification_source = "spotify"
+        
+        cyrillic_count, latin_count = self._count_scripts(f"{name} {artist}")
+        detected_lang = self._language_from_counts(cyrillic_count, latin_count)
+        if detected_lang != "other":
+            language = detected_lang
+        elif cyrillic_count:
+            language = "ru"
+        elif language not in FALLBACK_LANGUAGES:
+            language = "en"
+        
+        if not artist or artist.lower() in UNKNOWN_ARTIST_NAMES:
+            artist = "Unknown Artist"
+        
+        if not spotify_url and spotify_id and spotify_id not in INVALID_SPOTIFY_IDS:
+            spotify_url = f"https://open.spotify.com/track/{spotify_id}"
+        
+        return ValidatedTrack(
+            spotify_id=spotify_id,
+            name=name,
+            artist=artist,
+            year=year,
+            language=language,
+            genres=genres if isinstance(genres, list) else [],
+            spotify_url=spotify_url,
+            is_verified=is_verified,
+            verification_source=verification_source
+        )
     
     def validate_and_enrich(
         self,
         tracks: List[Dict],
-        max_spotify_calls: int = 3,
+        max_spotify_calls: Optional[int] = 3,
         use_gigachat: bool = False
     ) -> List[ValidatedTrack]:
-        validated = []
+        to_verify = tracks if max_spotify_calls is None else tracks[:max_spotify_calls]
+        spotify_infos = self.fetch_spotify_info([track.get("spotify_id", "") for track in to_verify])
         
-        for i, track in enumerate(tracks):
-            verify_spotify = i < max_spotify_calls
-            
-            result = self.validate_tracks(
-                [track], 
-                verify_spotify=verify_spotify,
-                use_gigachat=False
-            )
-            
-            if result:
-                validated.append(result[0])
+        validated = [
+            self._validate_track(track, spotify_infos.get(track.get("spotify_id", "")) if i < len(to_verify) else None)
+            for i, track in enumerate(tracks)
+        ]
         
         if use_gigachat and validated:
             track_dicts = [v.to_dict() for v in validated]
@@ -244,14 +279,37 @@ class TrackValidator:
                         validated[i].artist = enriched_data["artist_suggested"]
         
         return validated
+    
+    def enrich_tracks(self, tracks: List[Any], max_spotify_calls: Optional[int] = None) -> List[Any]:
+        to_verify = tracks if max_spotify_calls is None else tracks[:max_spotify_calls]
+        spotify_infos = self.fetch_spotify_info([track.spotify_id for track in to_verify])
+        
+        for track in tracks:
+            track.apply_validated(self._validate_track(track.to_dict(), spotify_infos.get(track.spotify_id)))
+        
+        return tracks
+    
+    async def aenrich_tracks(self, tracks: List[Any], max_spotify_calls: Optional[int] = None) -> List[Any]:
+        return await asyncio.to_thread(self.enrich_tracks, tracks, max_spotify_calls)
+    
+    async def avalidate_and_enrich(
+        self,
+        tracks: List[Dict],
+        max_spotify_calls: Optional[int] = None,
+        use_gigachat: bool = False
+    ) -> List[ValidatedTrack]:
+        return await asyncio.to_thread(self.validate_and_enrich, tracks, max_spotify_calls, use_gigachat)
 
 
 _validator_instance: Optional[TrackValidator] = None
+_validator_lock = threading.Lock()
 
 
 def get_track_validator() -> TrackValidator:
     global _validator_instance
     if _validator_instance is None:
-        _validator_instance = TrackValidator()
+        with _validator_lock:
+            if _validator_instance is None:
+                _validator_instance = TrackValidator()
     return _validator_instance
 
@@ -1,53 +1,84 @@
 import asyncio
 import logging
-from pydantic import PrivateAttr
+import random
+from typing import Optional
+
 from langchain_gigachat import GigaChat as LangGigaChat
 
-from config.settings import (
-    GIGACHAT_API_KEY,
-    DEFAULT_MODEL,
-    N_RETRY,
-    RETRY_DELAY,
-    TASK_SEMAPHORE,
-)
+from config.settings import settings, get_task_semaphore
 
 logger = logging.getLogger(__name__)
 
+RETRY_MAX_DELAY = 30.0
 
-class LangChainGigaChatWithLimit(LangGigaChat):
-    _semaphore: asyncio.Semaphore = PrivateAttr()
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self._semaphore = TASK_SEMAPHORE
+def _retry_after(error: Exception) -> Optional[float]:
+    value = getattr(error, "retry_after", None)
+    if value is None:
+        headers = getattr(getattr(error, "response", None), "headers", None) or {}
+        value = headers.get("Retry-After")
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
 
+def _backoff_delay(attempt: int, error: Exception) -> float:
+    delay = _retry_after(error)
+    if delay is None:
+        delay = random.uniform(0, min(RETRY_MAX_DELAY, settings.retry_delay * 2 ** attempt))
+    return min(delay, RETRY_MAX_DELAY)
+
+
+class LangChainGigaChatWithLimit(LangGigaChat):
     async def _agenerate(self, *args, **kwargs):
         last_exception = None
 
-        for attempt in range(N_RETRY):
-            try:
-                async with self._semaphore as acquired_request_id:
-                    result = await super()._agenerate(*args, **kwargs)
-                return result
-            except Exception as e:
-                last_exception = e
-                logger.warning(f"Attempt {attempt + 1}/{N_RETRY} failed: {e}")
+        async with get_task_semaphore():
+            for attempt in range(settings.n_retry):
+                try:
+                    return await super()._agenerate(*args, **kwargs)
+                except Exception as e:
+                    last_exception = e
+                    logger.warning("Attempt %d/%d failed: %s", attempt + 1, settings.n_retry, e)
+
+                    if attempt < settings.n_retry - 1:
+                        await asyncio.sleep(_backoff_delay(attempt, e))
+
+        raise last_exception
+
+    async def _astream(self, *args, **kwargs):
+        last_exception = None
+
+        async with get_task_semaphore():
+            for attempt in range(settings.n_retry):
+                started = False
+                try:
+                    async for chunk in super()._astream(*args, **kwargs):
+                        started = True
+                        yield chunk
+                    return
+                except Exception as e:
+                    if started:
+                        raise
+                    last_exception = e
+                    logger.warning("Stream attempt %d/%d failed: %s", attempt + 1, settings.n_retry, e)
 
-                if attempt < N_RETRY - 1:
-                    await asyncio.sleep(RETRY_DELAY)
+                    if attempt < settings.n_retry - 1:
+                        await asyncio.sleep(_backoff_delay(attempt, e))
 
         raise last_exception
 
 
 def get_llm() -> LangChainGigaChatWithLimit:
-    if not GIGACHAT_API_KEY:
+    if not settings.gigachat_api_key:
         raise ValueError("GIGACHAT_API_KEY not found in .env")
 
     return LangChainGigaChatWithLimit(
-        credentials=GIGACHAT_API_KEY,
+        credentials=settings.gigachat_api_key,
         verify_ssl_certs=False,
         scope="GIGACHAT_API_CORP",
         timeout=600,
         temperature=0.2,
-        model=DEFAULT_MODEL
+        model=settings.default_model
     )